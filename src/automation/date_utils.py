@@ -1,16 +1,139 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from time import perf_counter
+import os
+import json
+import threading
 import numpy as np
 import pandas as pd
 
 
+def _to_days(dates):
+    """Dates (str, datetime, np.datetime64, pd.Timestamp or array-like of them) as datetime64[D]."""
+    if np.ndim(dates) == 0:
+        return np.datetime64(pd.Timestamp(dates), 'D')
+    return np.asarray(pd.to_datetime(np.asarray(dates)).values, dtype="datetime64[D]")
+
+
+class BusinessCalendar(object):
+    """
+    Holiday calendar compiled once into a np.busdaycalendar, with a set of holidays for O(1) lookups.
+
+    Named calendars are memoised, so BusinessCalendar.get("UK") builds the calendar on first use only. Can be
+    passed wherever date_utils functions take a holidays list.
+
+    Example
+    -------
+    >>> uk = BusinessCalendar.get("UK", path="C:/data/uk_holidays.csv")
+    >>> uk.is_business_day(["2019-12-25", "2019-12-27"])
+    >>> last_business_date(holidays=uk, date="2019-12-26")
+    """
+
+    _calendars = {}
+    _calendars_lock = threading.Lock()
+
+    def __init__(self, holidays, name=None, weekmask="1111100"):
+        """
+        Parameters
+        ----------
+        holidays : list
+            Holiday dates, anything np.datetime64 can parse.
+        name : str, optional
+            Calendar name.
+        weekmask : str
+            Business days of the week from Monday, defaults to "1111100" (Monday to Friday).
+        """
+        self.name = name
+        self.holidays = np.unique(_to_days(list(holidays))) if len(holidays) else np.array([], "datetime64[D]")
+        self.busdaycal = np.busdaycalendar(weekmask=weekmask, holidays=self.holidays)
+        self._holiday_set = frozenset(self.holidays.tolist())
+
+    def __repr__(self):
+        return f"BusinessCalendar(name={self.name!r}, holidays={len(self.holidays)})"
+
+    @classmethod
+    def from_file(cls, path, name=None, column=None, weekmask="1111100"):
+        """
+        Builds a calendar from a CSV (holidays in `column`, defaults to the first column) or a JSON file (list of
+        dates, or dictionary with the list under "holidays").
+        """
+        if path.lower().endswith(".json"):
+            with open(path) as fp:
+                holidays = json.load(fp)
+            if isinstance(holidays, dict):
+                holidays = holidays["holidays"]
+        else:
+            df = pd.read_csv(path)
+            holidays = df[column if column is not None else df.columns[0]].dropna().tolist()
+        return cls(holidays, name=name or os.path.splitext(os.path.basename(path))[0], weekmask=weekmask)
+
+    @classmethod
+    def get(cls, name, holidays=None, path=None, **kwargs):
+        """
+        Memoised calendar by name. The first call builds it from `holidays` or `path` (see from_file), later calls
+        return the same instance.
+        """
+        with cls._calendars_lock:
+            if name not in cls._calendars:
+                if holidays is not None:
+                    cls._calendars[name] = cls(holidays, name=name, **kwargs)
+                elif path is not None:
+                    cls._calendars[name] = cls.from_file(path, name=name, **kwargs)
+                else:
+                    raise KeyError(f"Calendar '{name}' not built yet, pass holidays or path.")
+            return cls._calendars[name]
+
+    @classmethod
+    def clear(cls, name=None):
+        """Forgets memoised calendars, one or all of them."""
+        with cls._calendars_lock:
+            if name is None:
+                cls._calendars.clear()
+            else:
+                cls._calendars.pop(name, None)
+
+    def is_holiday(self, date):
+        """O(1) check of a single date against the holidays."""
+        return _to_days(date).item() in self._holiday_set
+
+    def is_business_day(self, dates):
+        return np.is_busday(_to_days(dates), busdaycal=self.busdaycal)
+
+    def offset(self, dates, offsets, roll="forward"):
+        """Dates moved by `offsets` business days, see np.busday_offset for `roll`."""
+        return np.busday_offset(_to_days(dates), offsets, roll=roll, busdaycal=self.busdaycal)
+
+    def range(self, start, end):
+        """Business days from start (inclusive) to end (exclusive)."""
+        days = np.arange(_to_days(start), _to_days(end), dtype="datetime64[D]")
+        return days[np.is_busday(days, busdaycal=self.busdaycal)]
+
+    def count_between(self, start, end):
+        """Number of business days from start (inclusive) to end (exclusive), batched over arrays."""
+        return np.busday_count(_to_days(start), _to_days(end), busdaycal=self.busdaycal)
+
+    def last_business_date(self, dates):
+        """Last business day strictly before each date."""
+        # A non business day first rolls forward to the next business day, so stepping back one lands on the last
+        # business day before the date
+        return self.offset(dates, -1, roll="forward")
+
+
+def _as_calendar(holidays):
+    if isinstance(holidays, BusinessCalendar):
+        return holidays
+    if holidays is None:
+        raise AssertionError("Please input list of holidays.")
+    return BusinessCalendar(holidays)
+
+
 def last_business_date(holidays=None, date=None):
     """
     Input date and retrieves last business date. Takes holidays and weekends into account using holiday list as input.
 
     Parameter
     ----------
-    holidays : list
-        List of holiday dates in np.datetime64
+    holidays : list or BusinessCalendar
+        List of holiday dates in np.datetime64, or a prebuilt BusinessCalendar
     date : str, default datetime today
         Date input should be YYYY-MM-DD
 
@@ -27,8 +150,7 @@ def last_business_date(holidays=None, date=None):
     >>> last_business_date("2019-10-14") # should return "2019-10-11" (Monday returns Friday)
     """
 
-    if holidays is None:
-        raise AssertionError("Please input list of holidays.")
+    calendar = _as_calendar(holidays)
 
     if date is None:
         current_date = np.datetime64(datetime.today(), 'D')
@@ -36,23 +158,49 @@ def last_business_date(holidays=None, date=None):
     else:
         current_date = np.datetime64(date)
 
-    # If found in holiday params, offset set to 0
-    if current_date in holidays:
-        offsets = 0
+    return calendar.last_business_date(current_date)
 
-    # If not found in holiday params, offset set to -1 to get last business day
-    else:
-        if pd.to_datetime(current_date).weekday() == 5 or pd.to_datetime(current_date).weekday() == 6:
-            offsets = 0
 
-        else:
-            offsets = -1
+def look_back_matrix(anchor_dates, num, holidays=None, busdaycal=None):
+    """
+    Look back business dates for many anchor dates at once, accounting for holidays and weekends.
+
+    Row i holds the same dates look_back_dates(num, holidays, start_date=anchor_dates[i]) returns: the num business
+    days before the anchor date, latest first. Computed in a single np.busday_offset pass over a business day
+    calendar that is compiled once.
+
+    Parameters
+    ----------
+    anchor_dates : array-like
+        Dates (str YYYY-MM-DD, np.datetime64, datetime or pd.Timestamp) to look back from.
+    num : int
+        Input number of look back days
+    holidays : list or BusinessCalendar
+        List of holiday dates in np.datetime64 or a prebuilt BusinessCalendar, not needed if busdaycal is given.
+    busdaycal : np.busdaycalendar, optional
+        Precompiled business day calendar, eg. np.busdaycalendar(holidays=holidays).
+
+    Returns
+    -------
+    np.ndarray of datetime64[D], shape (len(anchor_dates), num)
+
+    Example
+    -------
+    >>> hols = np.array(["2019-12-25", "2019-12-26"], dtype="datetime64[D]")
+    >>> look_back_matrix(["2019-12-27", "2020-01-06"], num=3, holidays=hols)
+    """
+    if busdaycal is None:
+        busdaycal = _as_calendar(holidays).busdaycal
 
-    return np.busday_offset(current_date, offsets=offsets, roll='preceding',
-                            holidays=holidays)
+    anchors = _to_days(np.atleast_1d(anchor_dates))
 
+    # The previous business day of any date d is busday_offset(d, -1, roll='forward'): a non business day first
+    # rolls forward to the next business day, so stepping back one lands on the last business day before d.
+    offsets = -np.arange(1, num + 1)
+    return np.busday_offset(anchors[:, None], offsets[None, :], roll='forward', busdaycal=busdaycal)
 
-def look_back_dates(num, holidays, start_date=datetime.today().strftime('%Y-%m-%d')):
+
+def look_back_dates(num, holidays, start_date=None):
     """
     Look back dates, accounting for holidays and weekends.
 
@@ -60,8 +208,8 @@ def look_back_dates(num, holidays, start_date=datetime.today().strftime('%Y-%m-%
     ----------
     num : int
         Input number of look back days
-    holidays : list
-        List of holiday dates in np.datetime64
+    holidays : list or BusinessCalendar
+        List of holiday dates in np.datetime64, or a prebuilt BusinessCalendar
     start_date : str
         Input date format YYYY-MM-DD, defaults to today's date
 
@@ -71,24 +219,116 @@ def look_back_dates(num, holidays, start_date=datetime.today().strftime('%Y-%m-%
 
     Example
     -------
-    >>> look_back_dates(num=5)
+    >>> look_back_dates(num=5, holidays=[np.datetime64("2019-12-25")])
     """
+    if start_date is None:
+        start_date = datetime.today().strftime('%Y-%m-%d')
+
+    return list(look_back_matrix([start_date], num, holidays=holidays)[0])
+
+
+# Excel serial 0 is 1899-12-30 for all dates from 1900-03-01 on. Excel also counts the non-existent 1900-02-29 (serial
+# 60), so serials below 60 are one day ahead of that epoch.
+_EXCEL_EPOCH = np.datetime64("1899-12-30", "D")
+_EXCEL_EPOCH_NS = _EXCEL_EPOCH.astype("datetime64[ns]").astype(np.int64)
+_EXCEL_LEAP_BUG_SERIAL = 60
+_NS_PER_DAY = 86400 * 10 ** 9
+
+
+def excel_to_npdatetime(date, unit="ms"):
+    """
+    Excel date serial to numpy datetime, vectorised over arrays and pd.Series.
+
+    Parameters
+    ----------
+    date : float, array-like or pd.Series
+        Excel serials, the fraction is the time of day. NaN (and the non-existent 1900-02-29, serial 60) give NaT.
+    unit : str
+        Resolution the time of day is rounded to, defaults to 'ms'.
+
+    Returns
+    -------
+    np.ndarray of datetime64[unit] (1 element for a scalar input), or pd.Series with the same index if a pd.Series
+    is given.
+
+    Example
+    -------
+    >>> excel_to_npdatetime([43831, 43831.5, np.nan])  # 2020-01-01, 2020-01-01 12:00, NaT
+    """
+    serial = np.atleast_1d(np.asarray(date, dtype=np.float64))
+
+    nat = ~np.isfinite(serial) | (serial == _EXCEL_LEAP_BUG_SERIAL)
+    serial = np.where(serial < _EXCEL_LEAP_BUG_SERIAL, serial + 1, serial)
 
-    look_back_lst = []
-    x = 0
-    while x < num:
-        start_date = last_business_date(date=start_date, holidays=holidays)
-        x += 1
-        look_back_lst.append(start_date)
-    return look_back_lst
+    ticks_per_day = _NS_PER_DAY // np.timedelta64(1, unit).astype("timedelta64[ns]").astype(np.int64)
+    ticks = np.round(serial * ticks_per_day)
+    ticks[nat] = 0
 
+    out = _EXCEL_EPOCH.astype(f"datetime64[{unit}]") + ticks.astype(np.int64).astype(f"timedelta64[{unit}]")
+    out[nat] = np.datetime64("NaT")
 
-def excel_to_npdatetime(date):
-    """Excel date serial to numpy datetime"""
-    return np.array(["1899-12-30"], dtype="datetime64[D]") + date
+    if isinstance(date, pd.Series):
+        return pd.Series(out, index=date.index, name=date.name)
+    return out
 
 
 def datetime_to_excel(date):
-    """Datetime to excel date serial"""
-    delta = date.to_datetime() - datetime(1899, 12, 30)
-    return (delta.days.astype(float) + delta.seconds.astype(float) / 86400).astype(int)
\ No newline at end of file
+    """
+    Datetime to excel date serial, vectorised over arrays and pd.Series.
+
+    Parameters
+    ----------
+    date : datetime-like, array-like or pd.Series
+        Dates, anything pd.to_datetime can parse. NaT gives NaN.
+
+    Returns
+    -------
+    float serial (days, the fraction is the time of day), np.ndarray of float serials, or pd.Series with the same
+    index if a pd.Series is given.
+    """
+    values = pd.to_datetime(date)
+    if np.ndim(values) == 0:
+        values = np.array([values.to_datetime64()])
+    ns = np.asarray(values, dtype="datetime64[ns]").view(np.int64)
+
+    nat = ns == np.iinfo(np.int64).min
+    serial = (ns - _EXCEL_EPOCH_NS) / _NS_PER_DAY
+    serial = np.where(serial < _EXCEL_LEAP_BUG_SERIAL + 1, serial - 1, serial)
+    serial[nat] = np.nan
+
+    if isinstance(date, pd.Series):
+        return pd.Series(serial, index=date.index, name=date.name)
+    if np.ndim(date) == 0:
+        return serial[0]
+    return serial
+
+
+def benchmark_excel_conversion(n_rows=10000000):
+    """
+    Times excel_to_npdatetime and datetime_to_excel on `n_rows` serials, against a row by row conversion
+    (measured on 100000 rows and scaled up).
+
+    Returns
+    -------
+    pd.DataFrame of seconds per method.
+    """
+    serials = np.random.uniform(1, 60000, n_rows).round(4)
+    timings = {}
+
+    time_start = perf_counter()
+    dates = excel_to_npdatetime(serials)
+    timings["excel_to_npdatetime"] = perf_counter() - time_start
+
+    time_start = perf_counter()
+    datetime_to_excel(dates)
+    timings["datetime_to_excel"] = perf_counter() - time_start
+
+    sample = serials[:100000]
+    time_start = perf_counter()
+    for x in sample:
+        d = datetime(1899, 12, 30) + timedelta(days=float(x))
+        delta = d - datetime(1899, 12, 30)
+        delta.days + delta.seconds / 86400
+    timings["row by row (round trip, scaled)"] = (perf_counter() - time_start) * n_rows / len(sample)
+
+    return pd.DataFrame.from_dict(timings, orient="index", columns=["seconds"])
@@ -2,29 +2,183 @@
 Decorators are wrappers to modify the behaviour of functions and classes. To call decorators, use @decorator.
 """
 
-from time import time
+from time import perf_counter_ns, time, monotonic, sleep
+from urllib.parse import urlsplit
+from collections import deque, OrderedDict
 import warnings
 import functools
+import inspect
+import threading
+import tracemalloc
+import json
+import os
+import re
+import sys
+import pickle
+import hashlib
+import datetime
+import random
+import asyncio
+import numpy as np
+import pandas as pd
 
 
-def timer(_func=None, *, print_msg=None):
+class TimerRegistry(object):
+    """
+    Thread-safe in-process store of call timings recorded by @timer, and of event counters (eg. retries and
+    throttling from @retry and @rate_limited) under the same function names.
+
+    Keeps count/total/min/max per function plus the last `max_samples` durations for percentiles. When `enabled` is
+    False, decorated functions are called straight through and nothing is recorded.
+
+    Example
+    -------
+    >>> @timer(verbose=False)
+    ... def work(): ...
+    >>> timer_registry.to_dataframe()
+    """
+
+    def __init__(self, max_samples=10000, enabled=True):
+        self.max_samples = max_samples
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._counters = {}
+
+    def increment(self, name, counter, n=1):
+        """Adds `n` to the event counter `counter` of `name`."""
+        with self._lock:
+            counters = self._counters.setdefault(name, {})
+            counters[counter] = counters.get(counter, 0) + n
+
+    def record(self, name, elapsed_ns, memory_peak=None):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {"count": 0, "total_ns": 0, "min_ns": elapsed_ns, "max_ns": elapsed_ns,
+                                             "samples": deque(maxlen=self.max_samples), "memory_peak": None}
+            stats["count"] += 1
+            stats["total_ns"] += elapsed_ns
+            stats["min_ns"] = min(stats["min_ns"], elapsed_ns)
+            stats["max_ns"] = max(stats["max_ns"], elapsed_ns)
+            stats["samples"].append(elapsed_ns)
+            if memory_peak is not None:
+                stats["memory_peak"] = max(stats["memory_peak"] or 0, memory_peak)
+
+    @staticmethod
+    def _percentile(ordered, q):
+        # Nearest rank
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def summary(self):
+        """Dictionary of function name -> statistics, times in seconds, and counters."""
+        with self._lock:
+            snapshot = {name: dict(stats, samples=sorted(stats["samples"])) for name, stats in self._stats.items()}
+            counters = {name: dict(c) for name, c in self._counters.items()}
+
+        out = {name: {} for name in counters}
+        for name, stats in snapshot.items():
+            ordered = stats["samples"]
+            out[name] = {"count": stats["count"],
+                         "total": stats["total_ns"] / 1e9,
+                         "mean": stats["total_ns"] / stats["count"] / 1e9,
+                         "min": stats["min_ns"] / 1e9,
+                         "max": stats["max_ns"] / 1e9,
+                         "p50": self._percentile(ordered, 50) / 1e9,
+                         "p95": self._percentile(ordered, 95) / 1e9,
+                         "p99": self._percentile(ordered, 99) / 1e9,
+                         "memory_peak_bytes": stats["memory_peak"]}
+        for name, c in counters.items():
+            out[name].update(c)
+        return out
+
+    def to_dataframe(self):
+        """Statistics as a pd.DataFrame, one row per function, slowest total first."""
+        df = pd.DataFrame.from_dict(self.summary(), orient="index")
+        return df.sort_values("total", ascending=False) if "total" in df else df
+
+    def to_json(self, path=None):
+        """Statistics as a json string, also written to `path` if given."""
+        dump = json.dumps(self.summary(), indent=1)
+        if path is not None:
+            with open(path, "w") as fp:
+                fp.write(dump)
+        return dump
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._counters.clear()
+
+
+# Default registry used by @timer
+timer_registry = TimerRegistry()
+
+
+def timer(_func=None, *, print_msg=None, verbose=True, memory=False, registry=None):
     """
     Allows one to specify print_msg if need be. Useful for timing builtin methods.
+    Every call is also recorded in `registry` (see TimerRegistry), for sync and async functions.
 
     Parameter
     ---------
     print_msg : str
         Information to point user to newest version.
+    verbose : bool
+        Print the elapsed time of every call, defaults to True. Set to False on hot paths.
+    memory : bool
+        Also record the peak traced memory during the call with tracemalloc, defaults to False. Starts tracemalloc
+        if it is not tracing yet. The peak is process-wide, so it is approximate when other threads allocate. Before
+        Python 3.9 (no tracemalloc.reset_peak) it is only exact for calls that raise the process peak, other calls
+        record their net allocation.
+    registry : TimerRegistry, optional
+        Registry to record into, defaults to timer_registry.
     """
     def decorator_timer(func):
-        @functools.wraps(func)
-        def wrapper_timer(*args, **kwargs):
-            time_start = time()
-            result = func(*args, **kwargs)
-            time_end = time()
+        name = print_msg if print_msg is not None else f"{func.__module__}.{func.__qualname__}"
+        label = func.__name__ if print_msg is None else print_msg
+        reg = timer_registry if registry is None else registry
+
+        def start():
+            if memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                if hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+                return perf_counter_ns(), tracemalloc.get_traced_memory()
+            return perf_counter_ns(), None
 
-            print(f"{func.__name__ if print_msg is None else print_msg} took {(time_end - time_start):2.2f} seconds.")
-            return result
+        def stop(time_start, memory_start):
+            elapsed = perf_counter_ns() - time_start
+            memory_peak = None
+            if memory:
+                current, peak = tracemalloc.get_traced_memory()
+                # Without reset_peak, a peak not above the one at the start may predate the call
+                memory_peak = (peak if peak > memory_start[1] else current) - memory_start[0]
+            reg.record(name, elapsed, memory_peak)
+            if verbose:
+                print(f"{label} took {elapsed / 1e9:2.2f} seconds.")
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper_timer(*args, **kwargs):
+                if not reg.enabled:
+                    return await func(*args, **kwargs)
+                time_start, memory_start = start()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    stop(time_start, memory_start)
+        else:
+            @functools.wraps(func)
+            def wrapper_timer(*args, **kwargs):
+                if not reg.enabled:
+                    return func(*args, **kwargs)
+                time_start, memory_start = start()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    stop(time_start, memory_start)
         return wrapper_timer
 
     if _func is None:
@@ -33,6 +187,513 @@ def timer(_func=None, *, print_msg=None):
         return decorator_timer(_func)
 
 
+# Types whose repr is exact, anything else is hashed by content or pickled
+_REPR_TYPES = (str, bytes, int, float, complex, bool, type(None), np.generic, datetime.date, datetime.timedelta)
+
+
+def _hash_value(value, digest):
+    """Feeds `value` into `digest`, DataFrames and arrays by content rather than identity."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        digest.update(type(value).__name__.encode())
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr((list(value.columns), list(value.dtypes))).encode())
+        else:
+            digest.update(repr((value.name, value.dtype)).encode())
+        try:
+            digest.update(pd.util.hash_pandas_object(value, index=not isinstance(value, pd.Index)).values.tobytes())
+        except TypeError:
+            # eg. list cells are unhashable
+            digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    elif isinstance(value, (pd.Categorical, pd.api.extensions.ExtensionArray)):
+        digest.update(type(value).__name__.encode())
+        _hash_value(pd.Series(value), digest)
+    elif isinstance(value, np.ndarray):
+        digest.update(f"ndarray{value.dtype}{value.shape}".encode())
+        if value.dtype == object:
+            digest.update(pickle.dumps(value))
+        else:
+            digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for v in value:
+            _hash_value(v, digest)
+    elif isinstance(value, dict):
+        digest.update(f"dict{len(value)}".encode())
+        for k in sorted(value, key=repr):
+            _hash_value(k, digest)
+            _hash_value(value[k], digest)
+    elif isinstance(value, (set, frozenset)):
+        # Iteration order is not stable, hash the elements separately and sort
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for element_digest in sorted(hash_key(v) for v in value):
+            digest.update(element_digest.encode())
+    elif isinstance(value, _REPR_TYPES):
+        digest.update(f"{type(value).__name__}:{value!r}".encode())
+    else:
+        try:
+            digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            raise TypeError(f"Cannot build a cache key from {type(value).__name__}, pass key= to @cached") from e
+
+
+def hash_key(*args, **kwargs):
+    """Content hash of call arguments, the default key of @cached."""
+    digest = hashlib.sha1()
+    _hash_value(args, digest)
+    _hash_value(kwargs, digest)
+    return digest.hexdigest()
+
+
+def _sizeof(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else \
+            int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return sys.getsizeof(value)
+
+
+class _CallCache(object):
+    """
+    Thread-safe LRU store behind @cached, with optional TTL, size bounds and on-disk copies.
+
+    The function is evaluated outside the lock, so concurrent misses on the same key may both compute; the last
+    result wins.
+    """
+
+    def __init__(self, name, max_entries=128, max_bytes=None, ttl=None, cache_dir=None, disk_format="pickle"):
+        if disk_format not in ("pickle", "parquet"):
+            raise ValueError("disk_format must be 'pickle' or 'parquet'")
+
+        self.name = name
+        # Qualified names of nested functions contain '<locals>', which Windows does not allow in file names
+        self._file_prefix = re.sub(r"[^\w.-]", "_", name) + "-"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.disk_format = disk_format
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires, size), least recently used first
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "expired": 0}
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, f"{self._file_prefix}{key}")
+        return base + ".parquet", base + ".pkl"
+
+    def _read_disk(self, key):
+        """Returns (found, value, expires), entries expiring `ttl` after their file was written."""
+        for path in self._paths(key):
+            if not os.path.exists(path):
+                continue
+            expires = None if self.ttl is None else os.path.getmtime(path) + self.ttl
+            if expires is not None and expires <= time():
+                os.remove(path)
+                return False, None, None
+            if path.endswith(".parquet"):
+                return True, pd.read_parquet(path), expires
+            with open(path, "rb") as fp:
+                return True, pickle.load(fp), expires
+        return False, None, None
+
+    def _write_disk(self, key, value):
+        parquet_path, pickle_path = self._paths(key)
+        if self.disk_format == "parquet" and isinstance(value, pd.DataFrame):
+            try:
+                value.to_parquet(parquet_path)
+                return
+            except (ValueError, TypeError, ImportError):
+                # eg. non string column names, fall back to pickle
+                pass
+        tmp = pickle_path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fp:
+            pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, pickle_path)
+
+    def get(self, key):
+        """Returns (found, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires, size = entry
+                if expires is None or expires > time():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return True, value
+                del self._entries[key]
+                self._bytes -= size
+                self._stats["expired"] += 1
+
+        if self.cache_dir is not None:
+            found, value, expires = self._read_disk(key)
+            if found:
+                self._store(key, value, expires)
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                return True, value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return False, None
+
+    def _store(self, key, value, expires=None):
+        size = _sizeof(value) if self.max_bytes is not None else 0
+        if expires is None and self.ttl is not None:
+            expires = time() + self.ttl
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Larger than the whole cache, keep on disk only
+                return
+            self._entries[key] = (value, expires, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or \
+                    (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def put(self, key, value):
+        self._store(key, value)
+        if self.cache_dir is not None:
+            self._write_disk(key, value)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self, disk=True):
+        """Empties the cache, including files on disk unless disk=False. Statistics are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if disk and self.cache_dir is not None:
+            for file in os.listdir(self.cache_dir):
+                if file.startswith(self._file_prefix):
+                    os.remove(os.path.join(self.cache_dir, file))
+
+
+def cached(_func=None, *, max_entries=128, max_bytes=None, ttl=None, key=None, cache_dir=None,
+           disk_format="pickle"):
+    """
+    Memoises a function's results, keyed on a content hash of its arguments. Works for sync and async functions.
+    The decorated function gets `cache_stats()` and `cache_clear()` attributes.
+
+    Parameter
+    ---------
+    max_entries : int
+        Results kept in memory, least recently used are evicted first. Defaults to 128.
+    max_bytes : int, optional
+        Memory bound on cached results (DataFrames by deep memory usage, arrays by nbytes). Defaults to None.
+    ttl : float, optional
+        Seconds a result stays valid, in memory and on disk. Defaults to None, never expires.
+    key : callable, optional
+        key(*args, **kwargs) -> str, defaults to hash_key which hashes DataFrames and arrays by content.
+    cache_dir : str, optional
+        Folder to also persist results in, so they survive process restarts. Defaults to None, memory only.
+    disk_format : str
+        'pickle' (default) or 'parquet'. Parquet is used for DataFrame results only, anything else is pickled.
+
+    Example
+    -------
+    >>> @cached(ttl=3600, cache_dir="C:/cache", disk_format="parquet")
+    ... def daily_prices(ticker):
+    ...     ...
+    >>> daily_prices.cache_stats()
+    """
+    def decorator_cached(func):
+        cache = _CallCache(f"{func.__module__}.{func.__qualname__}", max_entries=max_entries, max_bytes=max_bytes,
+                           ttl=ttl, cache_dir=cache_dir, disk_format=disk_format)
+        make_key = hash_key if key is None else key
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper_cached(*args, **kwargs):
+                call_key = make_key(*args, **kwargs)
+                found, value = cache.get(call_key)
+                if found:
+                    return value
+                value = await func(*args, **kwargs)
+                cache.put(call_key, value)
+                return value
+        else:
+            @functools.wraps(func)
+            def wrapper_cached(*args, **kwargs):
+                call_key = make_key(*args, **kwargs)
+                found, value = cache.get(call_key)
+                if found:
+                    return value
+                value = func(*args, **kwargs)
+                cache.put(call_key, value)
+                return value
+
+        wrapper_cached.cache_stats = cache.stats
+        wrapper_cached.cache_clear = cache.clear
+        return wrapper_cached
+
+    if _func is None:
+        return decorator_cached
+    else:
+        return decorator_cached(_func)
+
+
+# Responses with these status codes are worth retrying
+RETRY_STATUSES = frozenset([408, 425, 429, 500, 502, 503, 504])
+
+
+def default_classifier(exc=None, result=None):
+    """
+    Default @retry classifier: retries on any exception and on results with a retryable `status_code` attribute
+    (eg. requests.Response with 429 or 5xx).
+    """
+    if exc is not None:
+        return True
+    return getattr(result, "status_code", None) in RETRY_STATUSES
+
+
+def _retry_after(result):
+    """Seconds asked for by a Retry-After header on `result`, if any."""
+    headers = getattr(result, "headers", None) or {}
+    value = headers.get("Retry-After")
+    return float(value) if value is not None and str(value).isdigit() else None
+
+
+def retry(_func=None, *, attempts=3, base_delay=0.5, max_delay=30.0, exceptions=(Exception,), classifier=None,
+          registry=None):
+    """
+    Retries a function with exponential backoff and full jitter: attempt n waits a random time between 0 and
+    min(max_delay, base_delay * 2**n). Works for sync and async functions.
+
+    Retries and final failures are counted in `registry` (counters 'retries' and 'retry_exhausted'), next to the
+    @timer statistics of the same function.
+
+    Parameter
+    ---------
+    attempts : int
+        Total calls before giving up, defaults to 3. The last exception is re-raised, or the last result returned.
+    base_delay : float
+        Backoff base in seconds, defaults to 0.5.
+    max_delay : float
+        Cap on a single wait in seconds, defaults to 30. A larger Retry-After header on the result is honoured.
+    exceptions : tuple
+        Exception types that may be retried, defaults to (Exception,). Others propagate immediately.
+    classifier : callable, optional
+        classifier(exc=None, result=None) -> bool, whether to retry. Defaults to default_classifier.
+    registry : TimerRegistry, optional
+        Registry to count into, defaults to timer_registry.
+
+    Example
+    -------
+    >>> @retry(attempts=5, exceptions=(RequestException,))
+    ... def get(url):
+    ...     return session.get(url, timeout=10)
+    """
+    def decorator_retry(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        reg = timer_registry if registry is None else registry
+        should_retry = default_classifier if classifier is None else classifier
+
+        def next_delay(attempt, exc, result):
+            """Seconds to wait before the next attempt, None to stop."""
+            if exc is not None:
+                if not isinstance(exc, exceptions) or not should_retry(exc=exc):
+                    return None
+            elif not should_retry(result=result):
+                return None
+            if attempt == attempts - 1:
+                reg.increment(name, "retry_exhausted")
+                return None
+            reg.increment(name, "retries")
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            retry_after = None if exc is not None else _retry_after(result)
+            return delay if retry_after is None else max(delay, retry_after)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper_retry(*args, **kwargs):
+                for attempt in range(attempts):
+                    try:
+                        result = await func(*args, **kwargs)
+                    except Exception as e:
+                        delay = next_delay(attempt, e, None)
+                        if delay is None:
+                            raise
+                    else:
+                        delay = next_delay(attempt, None, result)
+                        if delay is None:
+                            return result
+                    await asyncio.sleep(delay)
+        else:
+            @functools.wraps(func)
+            def wrapper_retry(*args, **kwargs):
+                for attempt in range(attempts):
+                    try:
+                        result = func(*args, **kwargs)
+                    except Exception as e:
+                        delay = next_delay(attempt, e, None)
+                        if delay is None:
+                            raise
+                    else:
+                        delay = next_delay(attempt, None, result)
+                        if delay is None:
+                            return result
+                    sleep(delay)
+        return wrapper_retry
+
+    if _func is None:
+        return decorator_retry
+    else:
+        return decorator_retry(_func)
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket refilled at `rate` tokens per second up to `capacity`.
+
+    Tokens are reserved under the lock and may go negative, so concurrent callers queue up fairly and each one
+    sleeps for its own share outside the lock.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self._tokens = self.capacity
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Takes `tokens` and returns the seconds to wait before using them."""
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= tokens
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class RateLimiter(object):
+    """
+    Token buckets keyed per host (or any key), created on first use. Share one instance between functions (and
+    threads) that hit the same upstream so they draw from the same budget.
+
+    Example
+    -------
+    >>> limiter = RateLimiter(rate=5, per=60)  # eg. alpha vantage free tier
+    >>> @rate_limited(limiter=limiter)
+    ... def get(url): ...
+    """
+
+    def __init__(self, rate, per=1.0, burst=None):
+        """
+        Parameters
+        ----------
+        rate : float
+            Calls allowed per `per` seconds, for each key.
+        per : float
+            Period in seconds, defaults to 1.
+        burst : int, optional
+            Calls allowed back to back after idling, defaults to `rate`.
+        """
+        self.rate = rate / per
+        self.burst = rate if burst is None else burst
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def reserve(self, key):
+        """Seconds to wait before a call for `key` may start."""
+        return self.bucket(key).reserve()
+
+
+def host_key(*args, **kwargs):
+    """Host of the first url argument (positional or `url=`), the default key of @rate_limited."""
+    for value in (kwargs.get("url"),) + args:
+        if isinstance(value, str) and "://" in value:
+            return urlsplit(value).netloc
+    return None
+
+
+def rate_limited(_func=None, *, rate=1.0, per=1.0, burst=None, key=None, limiter=None, registry=None):
+    """
+    Throttles calls with a token bucket per host, blocking (or awaiting, for async functions) until a token is free.
+
+    Throttled calls and the time spent waiting are counted in `registry` (counters 'throttled' and
+    'throttle_seconds').
+
+    Parameter
+    ---------
+    rate : float
+        Calls allowed per `per` seconds for each key, defaults to 1. Ignored if `limiter` is given.
+    per : float
+        Period in seconds, defaults to 1.
+    burst : int, optional
+        Calls allowed back to back after idling, defaults to `rate`.
+    key : callable, optional
+        key(*args, **kwargs) -> hashable bucket key. Defaults to host_key, the host of the first url argument;
+        calls without a url share one bucket.
+    limiter : RateLimiter, optional
+        Shared buckets, to spread one budget over several functions. Defaults to a new RateLimiter per function.
+    registry : TimerRegistry, optional
+        Registry to count into, defaults to timer_registry.
+
+    Example
+    -------
+    >>> @rate_limited(rate=2)
+    ... @retry(attempts=4)
+    ... def get(url):
+    ...     return session.get(url, timeout=10)
+    """
+    def decorator_rate_limited(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        reg = timer_registry if registry is None else registry
+        buckets = RateLimiter(rate, per, burst) if limiter is None else limiter
+        make_key = host_key if key is None else key
+
+        def reserve(args, kwargs):
+            wait = buckets.reserve(make_key(*args, **kwargs))
+            if wait:
+                reg.increment(name, "throttled")
+                reg.increment(name, "throttle_seconds", wait)
+            return wait
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper_rate_limited(*args, **kwargs):
+                wait = reserve(args, kwargs)
+                if wait:
+                    await asyncio.sleep(wait)
+                return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper_rate_limited(*args, **kwargs):
+                wait = reserve(args, kwargs)
+                if wait:
+                    sleep(wait)
+                return func(*args, **kwargs)
+        return wrapper_rate_limited
+
+    if _func is None:
+        return decorator_rate_limited
+    else:
+        return decorator_rate_limited(_func)
+
+
 def deprecated(_func=None, *, print_msg=None):
     """
     This is a decorator which can be used to mark functions as deprecated.
@@ -1,31 +1,41 @@
 import sqlite3
 import os
+import tempfile
+from time import perf_counter
+import numpy as np
 import pandas as pd
 
+# Applied to connections used for bulk loading: write ahead log, fewer fsyncs and a 256MB page cache
+BULK_PRAGMAS = {"journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "cache_size": -256 * 1024,
+                "temp_store": "MEMORY"}
 
-def sql_db(df, db_dir, db_name, tbl_name=None, query=None):
+
+def sql_db(df, db_dir, db_name, tbl_name=None, query=None, params=None):
     """
     Aggregated function to handle sqlite db creation/writing/querying to return a pandas DataFrame.
+    For repeated or large queries use SqliteDB, which keeps the connection open and can stream chunks.
     """
-    conn = sqlite3.connect(db_dir + "/" + db_name + '.sqlite', check_same_thread=False)
-
     if query is not None:
         print(f"Connecting to {db_name} database and querying...")
-        return pd.read_sql(query, conn)
+        with SqliteDB(db_dir, db_name) as db:
+            return db.query(query, params=params)
 
-    else:
-        if tbl_name is None:
-            raise AssertionError(f"Must specify table name to create new database or write new table.")
+    conn = sqlite3.connect(db_dir + "/" + db_name + '.sqlite', check_same_thread=False)
 
-        if os.path.exists(os.path.join(db_dir, db_name)):
-            print(f"Database {db_name} already exists.")
-            df.to_sql(tbl_name, conn)
-            print(f"{tbl_name} table created in {db_name} database")
+    if tbl_name is None:
+        raise AssertionError(f"Must specify table name to create new database or write new table.")
 
-        else:
-            print("Creating new database.")
-            df.to_sql(tbl_name, conn)
-            print(f"{db_name} database created in {db_dir} with table name {tbl_name}")
+    if os.path.exists(os.path.join(db_dir, db_name)):
+        print(f"Database {db_name} already exists.")
+        df.to_sql(tbl_name, conn)
+        print(f"{tbl_name} table created in {db_name} database")
+
+    else:
+        print("Creating new database.")
+        df.to_sql(tbl_name, conn)
+        print(f"{db_name} database created in {db_dir} with table name {tbl_name}")
 
     conn.close()
 
@@ -36,3 +46,285 @@ def drop_table(c, tbl_name):
     cursor.execute(q)
     c.close()
 
+
+def _quote(name):
+    """Quotes an sqlite identifier."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def _apply_pragmas(conn, pragmas):
+    for pragma, value in pragmas.items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+
+
+def _chunk_rows(chunk):
+    """Rows of `chunk` as tuples of python values sqlite3 can bind, NaN/NaT as NULL and datetimes as text."""
+    columns = []
+    for col in chunk.columns:
+        values = chunk[col]
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            values = values.dt.strftime("%Y-%m-%d %H:%M:%S")
+
+        if values.dtype != object and not values.hasnans:
+            # Numeric without nulls, tolist converts to python scalars in C
+            columns.append(values.to_numpy().tolist())
+        else:
+            values = values.astype(object)
+            columns.append(values.where(values.notna(), None).tolist())
+    return zip(*columns)
+
+
+def sql_bulk_load(df, db_dir, db_name, tbl_name, if_exists="append", key=None, chunksize=100000,
+                  index_columns=None, write_index=False, pragmas=None):
+    """
+    Bulk loads a DataFrame into an sqlite table with executemany inside a single transaction.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Data to load.
+    db_dir : str
+        Folder of the database.
+    db_name : str
+        Database name, the file is {db_dir}/{db_name}.sqlite.
+    tbl_name : str
+        Table to load into, created from the dtypes of `df` if it does not exist.
+    if_exists : str
+        'append' (default) to add rows, 'replace' to drop and recreate the table, 'fail' to raise if it exists.
+    key : list, optional
+        Column(s) identifying a row. Rows with a key already in the table are updated (upsert) rather than added.
+        A new table gets a unique constraint on the key.
+    chunksize : int
+        Rows converted and sent per executemany call, defaults to 100000.
+    index_columns : list, optional
+        Column(s) to create an index on once the data is loaded.
+    write_index : bool
+        Write the DataFrame index as a column, defaults to False.
+    pragmas : dict, optional
+        PRAGMAs applied to the connection, defaults to BULK_PRAGMAS.
+
+    Returns
+    -------
+    Number of rows loaded.
+
+    Example
+    -------
+    >>> sql_bulk_load(df, db_dir="C:/data", db_name="prices", tbl_name="daily", key=["date", "ticker"],
+    ...               index_columns=["ticker"])
+    """
+    conn = sqlite3.connect(os.path.join(db_dir, db_name + ".sqlite"), check_same_thread=False)
+    try:
+        _apply_pragmas(conn, BULK_PRAGMAS if pragmas is None else pragmas)
+        n_rows = _bulk_load(conn, df, tbl_name, if_exists=if_exists, key=key, chunksize=chunksize,
+                            index_columns=index_columns, write_index=write_index)
+    finally:
+        conn.close()
+
+    print(f"Loaded {n_rows} rows into {tbl_name} table in {db_name} database.")
+    return n_rows
+
+
+def _bulk_load(conn, df, tbl_name, if_exists="append", key=None, chunksize=100000, index_columns=None,
+               write_index=False):
+    """sql_bulk_load over an open connection, see sql_bulk_load for parameters."""
+    if if_exists not in ("append", "replace", "fail"):
+        raise ValueError("if_exists must be one of 'append', 'replace' or 'fail'")
+
+    if write_index:
+        df = df.reset_index()
+
+    if isinstance(key, str):
+        key = [key]
+
+    columns = list(df.columns)
+    col_sql = ", ".join(_quote(c) for c in columns)
+
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (tbl_name,)).fetchone()
+    if exists and if_exists == "fail":
+        raise ValueError(f"Table {tbl_name} already exists.")
+
+    sql = f"INSERT INTO {_quote(tbl_name)} ({col_sql}) VALUES ({', '.join('?' * len(columns))})"
+    if key:
+        updates = ", ".join(f"{_quote(c)}=excluded.{_quote(c)}" for c in columns if c not in key)
+        conflict = f" ON CONFLICT ({', '.join(_quote(c) for c in key)})"
+        sql += conflict + (f" DO UPDATE SET {updates}" if updates else " DO NOTHING")
+
+    # Single transaction for the whole load. sqlite3 only opens one implicitly before DML, so DROP/CREATE would
+    # otherwise commit straight away and a failed replace would lose the old table
+    with conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        if exists and if_exists == "replace":
+            conn.execute(f"DROP TABLE {_quote(tbl_name)}")
+            exists = None
+
+        if not exists:
+            definitions = [f"{_quote(c)} {_sql_type(df[c].dtype)}" for c in columns]
+            if key:
+                definitions.append(f"UNIQUE ({', '.join(_quote(c) for c in key)})")
+            conn.execute(f"CREATE TABLE {_quote(tbl_name)} ({', '.join(definitions)})")
+
+        for start in range(0, len(df), chunksize):
+            conn.executemany(sql, _chunk_rows(df.iloc[start:start + chunksize]))
+
+    # Indexing once after the load is much cheaper than maintaining the index on every insert
+    for col in index_columns or []:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(f'idx_{tbl_name}_{col}')} "
+                     f"ON {_quote(tbl_name)} ({_quote(col)})")
+    conn.commit()
+
+    return len(df)
+
+
+def _rows_to_df(rows, names, dtypes):
+    """
+    DataFrame from fetched rows, built column by column.
+
+    Rows are transposed once with zip, then each column is converted in a single call: declared dtypes straight
+    to typed arrays (None becomes NaN for floats, nullable dtypes for ints with NULLs), others inferred by pandas.
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+
+    data = {}
+    for name, column in zip(names, columns):
+        dtype = dtypes.get(name)
+        if dtype is None:
+            data[name] = column
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            data[name] = pd.to_datetime(column)
+        else:
+            try:
+                data[name] = np.asarray(column, dtype=dtype)
+            except (TypeError, ValueError):
+                # eg. NULLs in an integer column, fall back to pandas casting ('Int64' keeps them as <NA>)
+                data[name] = pd.Series(column, dtype=object).astype(dtype).values
+
+    return pd.DataFrame(data, columns=names)
+
+
+class SqliteDB(object):
+    """
+    Reusable connection to an sqlite database, for repeated queries and loads without reconnecting.
+
+    Example
+    -------
+    >>> with SqliteDB(db_dir="C:/data", db_name="prices") as db:
+    ...     df = db.query("SELECT * FROM daily WHERE ticker = ? AND date >= ?", params=("AAPL", "2020-01-01"),
+    ...                   dtypes={"close": "float64", "volume": "int64", "date": "datetime64[ns]"})
+    ...     for chunk in db.query("SELECT * FROM daily", chunksize=100000):
+    ...         print(chunk.shape)
+    """
+
+    def __init__(self, db_dir, db_name, pragmas=None):
+        """
+        Parameters
+        ----------
+        db_dir : str
+            Folder of the database.
+        db_name : str
+            Database name, the file is {db_dir}/{db_name}.sqlite.
+        pragmas : dict, optional
+            PRAGMAs applied once when connecting, eg. BULK_PRAGMAS. Defaults to None.
+        """
+        self.db_name = db_name
+        self.path = os.path.join(db_dir, db_name + ".sqlite")
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        _apply_pragmas(self.conn, pragmas or {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def query(self, sql, params=None, chunksize=None, dtypes=None):
+        """
+        Runs a query with bound parameters and returns the result as DataFrame(s).
+
+        Parameters
+        ----------
+        sql : str
+            Query, with ? (or :name) placeholders for parameters.
+        params : tuple or dict, optional
+            Values bound to the placeholders, never formatted into the query string.
+        chunksize : int, optional
+            If given, returns an iterator of DataFrames of at most `chunksize` rows.
+        dtypes : dict, optional
+            Column name -> dtype. Columns not listed are inferred.
+
+        Returns
+        -------
+        pd.DataFrame, or iterator of pd.DataFrame if chunksize is given.
+        """
+        cursor = self.conn.execute(sql, params or ())
+        names = [d[0] for d in cursor.description or []]
+        dtypes = dtypes or {}
+
+        if chunksize is None:
+            return _rows_to_df(cursor.fetchall(), names, dtypes)
+
+        def chunks():
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunksize)
+                    if not rows:
+                        return
+                    yield _rows_to_df(rows, names, dtypes)
+            finally:
+                cursor.close()
+
+        return chunks()
+
+    def execute(self, sql, params=None):
+        """Runs a statement with bound parameters and commits."""
+        with self.conn:
+            return self.conn.execute(sql, params or ()).rowcount
+
+    def bulk_load(self, df, tbl_name, **kwargs):
+        """sql_bulk_load over this connection, see sql_bulk_load for keyword arguments."""
+        n_rows = _bulk_load(self.conn, df, tbl_name, **kwargs)
+        print(f"Loaded {n_rows} rows into {tbl_name} table in {self.db_name} database.")
+        return n_rows
+
+
+def benchmark_bulk_load(n_rows=1000000, db_dir=None):
+    """
+    Times loading `n_rows` rows with sql_db (df.to_sql) against sql_bulk_load.
+
+    Returns
+    -------
+    pd.DataFrame of seconds per method.
+    """
+    db_dir = db_dir or tempfile.mkdtemp()
+    df = pd.DataFrame({"date": pd.date_range("2000-01-01", periods=n_rows, freq="min"),
+                       "ticker": np.random.choice(["AAPL", "MSFT", "GOOG", "AMZN"], n_rows),
+                       "close": np.random.rand(n_rows) * 100,
+                       "volume": np.random.randint(0, 10 ** 6, n_rows)})
+
+    timings = {}
+    time_start = perf_counter()
+    sql_db(df, db_dir, "benchmark_to_sql", tbl_name="prices")
+    timings["sql_db"] = perf_counter() - time_start
+
+    time_start = perf_counter()
+    sql_bulk_load(df, db_dir, "benchmark_bulk", tbl_name="prices", if_exists="replace")
+    timings["sql_bulk_load"] = perf_counter() - time_start
+
+    time_start = perf_counter()
+    sql_bulk_load(df, db_dir, "benchmark_upsert", tbl_name="prices", if_exists="replace", key=["date", "ticker"])
+    timings["sql_bulk_load (upsert key)"] = perf_counter() - time_start
+
+    return pd.DataFrame.from_dict(timings, orient="index", columns=["seconds"])
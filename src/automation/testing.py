@@ -1,12 +1,80 @@
 import unittest
 import os
-import re
+import io
+import sys
+import ast
+import json
+import threading
+import traceback
+from fnmatch import fnmatch
 import pandas as pd
-from time import time
+from time import time, perf_counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Test file path -> (mtime_ns, size, test_def_prefix, num_test_def, num_test_lines), see _scan_test_file
+_scan_cache = {}
+_scan_cache_lock = threading.Lock()
+
+
+def _count_test_defs(tree, test_def_prefix):
+    """Counts test functions at module level and test methods of classes (eg. unittest.TestCase subclasses)."""
+    def is_test(node):
+        return isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith(test_def_prefix)
+
+    count = 0
+    for node in tree.body:
+        if is_test(node):
+            count += 1
+        elif isinstance(node, ast.ClassDef):
+            count += sum(1 for child in node.body if is_test(child))
+    return count
+
+
+def _scan_test_file(path, test_def_prefix):
+    """(num_test_def, num_test_lines) of a test file, re-parsed only if its mtime or size changed."""
+    stat = os.stat(path)
+    with _scan_cache_lock:
+        cached = _scan_cache.get(path)
+    if cached is not None and cached[:3] == [stat.st_mtime_ns, stat.st_size, test_def_prefix]:
+        return cached[3], cached[4]
+
+    with open(path, "rb") as fp:
+        source = fp.read()
+    num_test_lines = len(source.splitlines())
+    try:
+        num_test_def = _count_test_defs(ast.parse(source, filename=path), test_def_prefix)
+    except SyntaxError:
+        print(f"Could not parse {path}, counting it as having no tests.")
+        num_test_def = 0
+
+    with _scan_cache_lock:
+        _scan_cache[path] = [stat.st_mtime_ns, stat.st_size, test_def_prefix, num_test_def, num_test_lines]
+    return num_test_def, num_test_lines
+
+
+def _scan_package(pkg_dir, test_file_prefix, test_def_prefix):
+    """module -> test details of one package, None if the package has no 'tests' subpackage."""
+    entries = {e.name: e for e in os.scandir(pkg_dir)}
+    if "tests" not in entries or not entries["tests"].is_dir():
+        return None
+
+    ut_dir = os.path.join(pkg_dir, "tests")
+    ut_files = set(os.listdir(ut_dir))
+
+    modules = {}
+    for m in sorted(name for name, e in entries.items() if name.endswith(".py") and e.is_file()):
+        # Concatenate 'test_' + module.py
+        test_module = test_file_prefix + m
+        if test_module in ut_files:
+            num_test_def, num_test_lines = _scan_test_file(os.path.join(ut_dir, test_module), test_def_prefix)
+            modules[m] = {"has_unit_test": True, "num_test_def": num_test_def, "num_test_lines": num_test_lines}
+        else:
+            modules[m] = {"has_unit_test": False, "num_test_def": 0, "num_test_lines": 0}
+    return modules
 
 
 def unit_test_analysis(src_dir, test_file_prefix='test_', test_def_prefix='test_', ignore_modules=None,
-                       ignore_packages=None):
+                       ignore_packages=None, cache_file=None, max_workers=8):
     """
     Checks packages for unittests and looks for test files corresponding for each module.
 
@@ -17,11 +85,16 @@ def unit_test_analysis(src_dir, test_file_prefix='test_', test_def_prefix='test_
     test_file_prefix: str, defaults to 'test_' so it will look for 'test_{module.py}'.
         Prefix for unit test file, default 'test_' - e.g. look for 'test_' + module.py.
     test_def_prefix : str
-        Prefix for unit test def, default 'test_' - e.g. will count lines '^def test_.*'.
+        Prefix for unit test def, default 'test_'. Test functions and test methods of classes are counted.
     ignore_modules : list
         Package files to ignore, default None.
     ignore_packages : list
         Packages to ignore, default None.
+    cache_file : str, optional
+        JSON file persisting per test file results between runs, so only changed files are re-parsed. Results are
+        always cached in memory for the lifetime of the process.
+    max_workers : int
+        Number of packages scanned concurrently, defaults to 8.
 
     Return
     -------
@@ -32,46 +105,32 @@ def unit_test_analysis(src_dir, test_file_prefix='test_', test_def_prefix='test_
     print(f"\n\nRunning unit test analysis.\n\n")
     print('-' * 40)
 
+    if cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file) as fp:
+            with _scan_cache_lock:
+                _scan_cache.update(json.load(fp))
+
     # Getting list of packages from src
-    pkg_dirs = [os.path.join(src_dir, i)
-                for i in os.listdir(src_dir)
-                if os.path.isdir(os.path.join(src_dir, i))]
-
-    # Check if there is a subpackage called 'tests' in each package
-    have_test_dir = {os.path.basename(i): 'tests' in os.listdir(i) for i in pkg_dirs}
-
-    pkg_and_modules = dict()
-    for i in pkg_dirs:
-        pkg_and_modules[os.path.basename(i)] = [j for j in os.listdir(i) if bool(re.search('\.py$', j))]
-
-    # package -> modules -> test details
-    full_dict = dict()
-    for pkg_name, lst_of_modules in pkg_and_modules.items():
-        # Packages containing subpackages 'tests'
-        if have_test_dir[pkg_name]:
-            ut_dir = os.path.join(src_dir, pkg_name, 'tests')
-            # Listing test modules within the subpackage
-            ut_files = os.listdir(ut_dir)
-            # To nest dictionary
-            full_dict[pkg_name] = {}
-            for m in lst_of_modules:
-                # Concatenate 'test_' + module.py
-                test_module = test_file_prefix + m
-                if test_module in ut_files:
-                    # read in the file, count the number of lines begining with def (or 'def test')
-                    # read the number of lines in file
-                    with open(os.path.join(ut_dir, test_module)) as fp:
-                        content = fp.readlines()
-                    test_defs = [c for c in content if bool(re.search(f'^def {test_def_prefix}', c.lstrip()))]
-                    has_unit_tests, num_test_def, num_test_lines = True, len(test_defs), len(content)
-                else:
-                    has_unit_tests, num_test_def, num_test_lines = False, 0, 0
-
-                full_dict[pkg_name][m] = {"has_unit_test": has_unit_tests,
-                                          "num_test_def": num_test_def,
-                                          "num_test_lines": num_test_lines}
-        else:
-            print(f"Excluding package '{pkg_name}' as it does not have subpackage 'tests'.")
+    pkg_dirs = [e.path for e in os.scandir(src_dir)
+                if e.is_dir() and e.name not in (ignore_packages or [])]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        scanned = pool.map(lambda d: _scan_package(d, test_file_prefix, test_def_prefix), pkg_dirs)
+
+        # package -> modules -> test details
+        full_dict = dict()
+        for pkg_dir, modules in zip(pkg_dirs, scanned):
+            pkg_name = os.path.basename(pkg_dir)
+            # Packages containing subpackages 'tests'
+            if modules is not None:
+                full_dict[pkg_name] = modules
+            else:
+                print(f"Excluding package '{pkg_name}' as it does not have subpackage 'tests'.")
+
+    if cache_file is not None:
+        with _scan_cache_lock:
+            with open(cache_file, "w") as fp:
+                json.dump(_scan_cache, fp)
 
     df = pd.DataFrame.from_dict({(i, j): full_dict[i][j]
                                  for i in full_dict.keys()
@@ -108,29 +167,154 @@ def unit_test_analysis(src_dir, test_file_prefix='test_', test_def_prefix='test_
     return df
 
 
-def run_tests(src_dir, paths):
+class _TimedTestResult(unittest.TextTestResult):
+    """TextTestResult also recording the wall time of every test."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.test_durations = {}
+        self._test_start = None
+
+    def startTest(self, test):
+        self._test_start = perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        self.test_durations[test.id()] = perf_counter() - self._test_start
+        super().stopTest(test)
+
+
+def _run_suite(suite, stream=None):
+    # Change buffer to False if you want don't want to suppress print statements
+    runner = unittest.TextTestRunner(stream=stream, verbosity=2, buffer=True, resultclass=_TimedTestResult)
+    return runner.run(suite)
+
+
+def _test_modules(tp, pattern="test_*.py"):
+    """Test module files under `tp`, relative to it. Like discover, only packages (with __init__.py) below `tp`."""
+    modules = []
+    for root, dirs, files in os.walk(tp):
+        dirs[:] = [d for d in dirs if os.path.isfile(os.path.join(root, d, "__init__.py"))]
+        for f in files:
+            if fnmatch(f, pattern):
+                modules.append(os.path.relpath(os.path.join(root, f), tp))
+    return sorted(modules)
+
+
+def _run_shard(tp, module):
+    """Runs one test module (in a worker process when parallel), returns a picklable summary of the result."""
+    t = perf_counter()
+    # Import by dotted name relative to `tp` as discover would, without picking up same named modules below it
+    if tp not in sys.path:
+        sys.path.insert(0, tp)
+    suite = unittest.TestLoader().loadTestsFromName(os.path.splitext(module)[0].replace(os.sep, "."))
+    stream = io.StringIO()
+    result = _run_suite(suite, stream=stream)
+    return {"output": stream.getvalue(),
+            "tests_run": result.testsRun,
+            "failures": len(result.failures),
+            "errors": len(result.errors),
+            "test_durations": result.test_durations,
+            "seconds": perf_counter() - t}
+
+
+def _shard_result(future):
+    """Result of a _run_shard future, a single error if the shard raised (eg. an unimportable module)."""
+    try:
+        return future.result()
+    except Exception:
+        return {"output": traceback.format_exc(),
+                "tests_run": 0,
+                "failures": 0,
+                "errors": 1,
+                "test_durations": {},
+                "seconds": 0.0}
+
+
+def _print_timings(test_durations, module_durations, slowest):
+    if module_durations:
+        print(f"\nSlowest test modules (seconds):")
+        print(pd.Series(module_durations).sort_values(ascending=False).head(slowest).to_string())
+    if test_durations:
+        print(f"\nSlowest tests (seconds):")
+        print(pd.Series(test_durations).sort_values(ascending=False).head(slowest).to_string())
+
+
+def run_tests(src_dir, paths, parallel=False, max_workers=None, durations_file=None, slowest=10):
+    """
+    Discovers and runs the unittests in each path, then prints a STATUS/FAILURES/ERRORS summary per path.
+
+    Parameters
+    ----------
+    src_dir : str
+        Directory the paths are relative to.
+    paths : list
+        Test directories, relative to src_dir.
+    parallel : bool
+        Run test modules as shards on a process pool, defaults to False (one after another).
+    max_workers : int, optional
+        Number of worker processes in parallel mode, defaults to the number of CPUs.
+    durations_file : str, optional
+        JSON file of module wall times, updated after every run. In parallel mode, modules that were slowest in the
+        previous run are scheduled first.
+    slowest : int
+        Number of slowest tests and modules reported, defaults to 10.
+
+    Returns
+    -------
+    pd.DataFrame of the summary.
+    """
     t = time()
     test_summary = dict()
+    test_durations, module_durations = {}, {}
+
+    previous = {}
+    if durations_file is not None and os.path.exists(durations_file):
+        with open(durations_file) as fp:
+            previous = json.load(fp)
+
+    shards = [(pth, module) for pth in paths for module in _test_modules(os.path.join(src_dir, pth))]
+    if not parallel:
+        # Lazily, so each module's output is printed as soon as it has run
+        results = ((pth, module, _run_shard(os.path.join(src_dir, pth), module)) for pth, module in shards)
+
+    else:
+        # Longest first, so a slow module does not start last and hold up the whole run
+        shards.sort(key=lambda shard: previous.get(os.path.join(*shard), 0), reverse=True)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [(pth, module, pool.submit(_run_shard, os.path.join(src_dir, pth), module))
+                       for pth, module in shards]
+            results = [(pth, module, _shard_result(future)) for pth, module, future in futures]
+        results.sort(key=lambda r: (paths.index(r[0]), r[1]))
+
     for pth in paths:
-        print("\n")
-        print('-' * 60)
-        print(f"\nRunning tests in: {pth}\n")
+        test_summary[pth] = {"STATUS": "PASSED", "FAILURES": 0, "ERRORS": 0}
+
+    for pth, module, result in results:
         print('-' * 60)
-        loader = unittest.TestLoader()
-        tp = os.path.join(src_dir, pth)
-        suite = loader.discover(tp, pattern="test_*.py")
-
-        # Change buffer to False if you want don't want to suppress print statements
-        runner = unittest.TextTestRunner(verbosity=2, buffer=True).run(suite)
-        if runner.failures or runner.errors:
-            status = "FAILED"
-        else:
-            status = "PASSED"
-        test_summary[pth] = {"STATUS": status,
-                             "FAILURES": len(runner.failures),
-                             "ERRORS": len(runner.errors)}
+        print(f"\nTests in: {os.path.join(pth, module)}\n")
+        print(result["output"])
+
+        summary = test_summary[pth]
+        summary["FAILURES"] += result["failures"]
+        summary["ERRORS"] += result["errors"]
+        if summary["FAILURES"] or summary["ERRORS"]:
+            summary["STATUS"] = "FAILED"
+
+        test_durations.update(result["test_durations"])
+        module_durations[os.path.join(pth, module)] = result["seconds"]
+
+    if durations_file is not None and module_durations:
+        with open(durations_file, "w") as fp:
+            json.dump(dict(previous, **module_durations), fp, indent=1)
+
     print(f"\nAll tests finished after {(time() - t)} seconds.")
-    print(pd.DataFrame.from_dict(test_summary, orient="index"))
+    _print_timings(test_durations, module_durations, slowest)
+
+    summary = pd.DataFrame.from_dict(test_summary, orient="index")
+    print(summary)
+    return summary
 
 
 if __name__ == "__main__":
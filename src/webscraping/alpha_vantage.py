@@ -2,14 +2,111 @@
 """
 
 import json
+import os
+import time
 
+import numpy as np
+import pandas as pd
 from alpha_vantage.timeseries import TimeSeries
 from alpha_vantage.techindicators import TechIndicators
 
+# Number of most recent bars returned by alpha vantage with outputsize='compact'
+COMPACT_BARS = 100
+
+# Default seconds before stored bars are considered stale, per interval
+DEFAULT_MAX_AGE = {'daily': 12 * 60 * 60, '1min': 60, '5min': 5 * 60, '15min': 15 * 60, '30min': 30 * 60,
+                   '60min': 60 * 60}
+
+
+class BarStore(object):
+    """
+    Local parquet store of price bars, one file per symbol under a folder per interval ('daily', '1min', ...).
+
+    Example
+    -------
+    >>> store = BarStore(store_dir="C:/data/alpha_vantage")
+    >>> store.read("AAPL", "daily")
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+
+    def _path(self, symbol, interval, ext="parquet"):
+        return os.path.join(self.store_dir, interval, f"{symbol}.{ext}")
+
+    def read(self, symbol, interval):
+        """Stored bars in time order, None if the symbol has not been stored yet."""
+        path = self._path(symbol, interval)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
+
+    def read_meta(self, symbol, interval):
+        """Alpha vantage meta data saved with the last fetch, None if missing."""
+        try:
+            with open(self._path(symbol, interval, ext="json")) as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return None
+
+    def age(self, symbol, interval):
+        """Seconds since the symbol was last refreshed, inf if it has not been stored yet."""
+        try:
+            return time.time() - os.path.getmtime(self._path(symbol, interval))
+        except FileNotFoundError:
+            return float("inf")
+
+    def append(self, symbol, interval, df, meta=None):
+        """
+        Merges `df` into the stored bars, newer rows win on duplicated timestamps.
+
+        The file is rewritten even if there are no new rows, which marks the symbol as refreshed.
+
+        Returns
+        -------
+        Number of rows added.
+        """
+        df = df.copy()
+        df.index = pd.to_datetime(df.index)
+
+        stored = self.read(symbol, interval)
+        n_stored = 0 if stored is None else len(stored)
+        if stored is not None:
+            df = pd.concat([stored, df])
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+
+        path = self._path(symbol, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then swap, so readers never see a half written file
+        df.to_parquet(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+        if meta is not None:
+            with open(self._path(symbol, interval, ext="json"), "w") as fp:
+                json.dump(meta, fp)
+
+        return len(df) - n_stored
+
 
 class Trade:
 
-    def __init__(self, region, category):
+    def __init__(self, region, category, store_dir=None, max_age=None, calls_per_minute=None):
+        """
+        Parameters
+        ----------
+        region : str
+            Tradingview stock region, eg. 'usa'.
+        category : str
+            Tradingview stock category, eg. 'large-cap'.
+        store_dir : str, optional
+            Folder of the local bar store. If given, daily_data/intraday_data serve stored bars and only fetch
+            newer ones. Defaults to None (always download full history).
+        max_age : dict, optional
+            Seconds before stored bars are stale per interval, overrides DEFAULT_MAX_AGE.
+        calls_per_minute : int, optional
+            API call budget every request is paced to, eg. 5 for the alpha vantage free tier. Defaults to None (no
+            pacing outside refresh_all).
+        """
 
         with open(r'C:\Users\Dencan Gan\Credentials\credentials.json') as json_cfg:
             credentials = json.load(json_cfg)
@@ -23,40 +120,291 @@ class Trade:
         self.time_series = TimeSeries(api, output_format='pandas')
         self.technical_indicator = TechIndicators(api)
 
-    def daily_data(self, stock):
-        data_daily, meta_data_daily = self.time_series.get_daily(symbol=stock, outputsize='full')
+        self.store = BarStore(store_dir) if store_dir is not None else None
+        self.max_age = dict(DEFAULT_MAX_AGE, **(max_age or {}))
+        self.call_spacing = 60.0 / calls_per_minute if calls_per_minute else 0.0
+        self._next_call = time.monotonic()
+
+    def _pace(self):
+        """Sleeps until the next API call fits the budget, every request to alpha vantage goes through here."""
+        wait = self._next_call - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._next_call = time.monotonic() + self.call_spacing
+
+    def _download(self, stock, interval, outputsize):
+        self._pace()
+        if interval == 'daily':
+            return self.time_series.get_daily(symbol=stock, outputsize=outputsize)
+        return self.time_series.get_intraday(symbol=stock, interval=interval, outputsize=outputsize)
+
+    @staticmethod
+    def _bars_since(last_timestamp, interval):
+        """Estimate of the number of bars published since `last_timestamp`, alpha vantage timestamps are US/Eastern."""
+        now = pd.Timestamp.now(tz='US/Eastern').tz_localize(None)
+        if interval == 'daily':
+            return np.busday_count(last_timestamp.date(), now.date())
+        return (now - last_timestamp) / pd.Timedelta(minutes=int(interval[:-3]))
+
+    def _bars(self, stock, interval, refresh=None):
+        """
+        Bars of `stock` through the local store: stored bars while fresh, otherwise fetch and merge newer bars.
+        Fetches outputsize='compact' when the gap since the last stored bar fits in it, 'full' otherwise or when the
+        compact bars turn out not to reach back to the last stored bar.
+
+        refresh : bool, optional
+            True to always fetch, False to never fetch if bars are stored, None to follow max_age.
+        """
+        if self.store is None:
+            return self._download(stock, interval, outputsize='full')
+
+        stored = self.store.read(stock, interval)
+        if stored is not None and not stored.empty:
+            stale = self.store.age(stock, interval) >= self.max_age[interval]
+            if refresh is False or (refresh is None and not stale):
+                return stored, self.store.read_meta(stock, interval)
+
+            last_timestamp = stored.index.max()
+            compact = self._bars_since(last_timestamp, interval) < COMPACT_BARS
+            data, meta = self._download(stock, interval, outputsize='compact' if compact else 'full')
+            data.index = pd.to_datetime(data.index)
+            if compact and not data.empty and data.index.min() > last_timestamp:
+                # Gap was underestimated, merging would leave a hole between the stored and compact bars
+                data, meta = self._download(stock, interval, outputsize='full')
+                data.index = pd.to_datetime(data.index)
+            data = data[data.index > last_timestamp]
+        else:
+            data, meta = self._download(stock, interval, outputsize='full')
+
+        self.store.append(stock, interval, data, meta)
+        return self.store.read(stock, interval), meta
+
+    def daily_data(self, stock, refresh=None):
+        data_daily, meta_data_daily = self._bars(stock, 'daily', refresh=refresh)
         return data_daily, meta_data_daily
 
-    def intraday_data(self, stock, interval='1min'):
-        data_intraday, meta_data_intraday = self.time_series.get_intraday(symbol=stock, interval=interval, outputsize='full')
+    def intraday_data(self, stock, interval='1min', refresh=None):
+        data_intraday, meta_data_intraday = self._bars(stock, interval, refresh=refresh)
         return data_intraday, meta_data_intraday
 
+    def refresh_all(self, symbols, interval='daily', calls_per_minute=5, force=False):
+        """
+        Brings the stored bars of every symbol up to date, spacing API calls to stay within `calls_per_minute`.
+        Every request counts, including the full refetch of a symbol whose compact bars left a gap.
+
+        Parameters
+        ----------
+        symbols : list
+            Symbols to refresh.
+        interval : str
+            'daily' or an intraday interval, eg. '1min'.
+        calls_per_minute : int
+            API call budget, defaults to 5 (alpha vantage free tier).
+        force : bool
+            Refresh symbols even if their stored bars are still fresh, defaults to False.
+
+        Returns
+        -------
+        pd.DataFrame with rows stored and status per symbol.
+        """
+        assert self.store is not None, "refresh_all needs a local store, initialise Trade with store_dir."
+
+        previous_spacing = self.call_spacing
+        self.call_spacing = max(previous_spacing, 60.0 / calls_per_minute)
+        summary = {}
+
+        try:
+            for symbol in symbols:
+                if not force and self.store.age(symbol, interval) < self.max_age[interval]:
+                    summary[symbol] = {"STATUS": "FRESH", "ROWS": len(self.store.read(symbol, interval))}
+                    continue
+
+                try:
+                    data, _ = self._bars(symbol, interval, refresh=True)
+                    summary[symbol] = {"STATUS": "REFRESHED", "ROWS": len(data)}
+                except Exception as error:
+                    summary[symbol] = {"STATUS": f"ERROR: {error}", "ROWS": None}
+        finally:
+            self.call_spacing = previous_spacing
+
+        return pd.DataFrame.from_dict(summary, orient="index")
+
     def simple_moving_average(self, stock):
+        self._pace()
         sma, meta_sma = self.technical_indicator.get_sma(symbol=stock)
         return sma, meta_sma
 
-    def execute(self, stock_data):
+    def execute(self, stock_data, sma=None):
+        """
+        Runs the trading rule over `stock_data`, see backtest.
+
+        Returns
+        -------
+        trades, summary : pd.DataFrame
+        """
+        return backtest(stock_data, sma=sma)
+
+
+def _next_higher(close, bound):
+    """
+    Index of the first later bar closing strictly above each bar, -1 if there is none before `bound`.
+
+    Binary lifting over a sparse table of range maxima, so all bars are resolved together in O(n log n).
+    """
+    n = len(close)
+    idx = np.arange(n)
+
+    # table[k][i] = max(close[i:i + 2**k])
+    table = [close]
+    step = 1
+    while step * 2 <= n:
+        prev = table[-1]
+        level = prev.copy()
+        level[:n - step] = np.maximum(prev[:n - step], prev[step:])
+        table.append(level)
+        step *= 2
+
+    # Advance pos over blocks that do not beat the bar's close, largest blocks first
+    pos = idx + 1
+    for k in range(len(table) - 1, -1, -1):
+        step = 2 ** k
+        fits = pos + step <= bound
+        beaten = table[k][np.minimum(pos, n - 1)] > close
+        pos = np.where(fits & ~beaten, pos + step, pos)
+
+    return np.where(pos < bound, pos, -1)
+
+
+def _follow_trades(start, jump, terminal):
+    """
+    All nodes on the paths start -> jump[start] -> ... until `terminal`, by pointer doubling.
+
+    After k rounds `nodes` holds every trade within 2**k steps of a start, so the number of rounds is
+    log2 of the longest trade sequence rather than the number of trades.
+    """
+    nodes = np.unique(start[start != terminal])
+    hop = jump
+    while True:
+        reached = hop[nodes]
+        reached = reached[reached != terminal]
+        if reached.size == 0:
+            return nodes
+        nodes = np.union1d(nodes, reached)
+        hop = hop[hop]
+
+
+def _sma_values(sma, index):
+    """Aligns an SMA (pd.Series, pd.DataFrame or alpha vantage json dict) on `index`."""
+    if isinstance(sma, dict):
+        sma = pd.DataFrame.from_dict(sma, orient='index')
+    if isinstance(sma, pd.DataFrame):
+        sma = sma['SMA'] if 'SMA' in sma else sma.iloc[:, 0]
+    sma = pd.to_numeric(sma, errors='coerce')
+    sma.index = pd.to_datetime(sma.index)
+    return sma.reindex(index).values
+
+
+def backtest(stock_data, sma=None, price_col='4. close'):
+    """
+    Vectorised version of the Trade.execute rule, over one or many symbols.
+
+    Enter at the close of the first bar, exit at the first later bar closing above the entry price (profit making),
+    then enter again at the close of the next bar. Bars are processed in time order.
+
+    Parameters
+    ----------
+    stock_data : pd.DataFrame or dict
+        Price frame as returned by Trade.daily_data/intraday_data, or dictionary of symbol -> price frame.
+    sma : pd.Series, pd.DataFrame, dict, optional
+        Precomputed simple moving average (eg. from Trade.simple_moving_average), or dictionary of symbol -> sma.
+        If given, a trade is only entered on bars closing above the SMA.
+    price_col : str
+        Column holding the close price, defaults to '4. close'.
+
+    Returns
+    -------
+    trades : pd.DataFrame
+        One row per trade: symbol, entry/exit time and price, profit and bars held. An entry without an exit yet
+        is reported with NaN exit and profit.
+    summary : pd.DataFrame
+        Per symbol: number of closed trades, total/mean profit, mean bars held and whether a position is open.
+
+    Example
+    -------
+    >>> trade = Trade(region='usa', category='large-cap')
+    >>> data = {s: trade.daily_data(s)[0] for s in ['AAPL', 'MSFT']}
+    >>> trades, summary = backtest(data)
+    """
+    if isinstance(stock_data, pd.DataFrame):
+        stock_data, sma = {None: stock_data}, {None: sma}
+    elif not (isinstance(sma, dict) and set(sma) <= set(stock_data)):
+        # One sma shared by all symbols
+        sma = {symbol: sma for symbol in stock_data}
+
+    symbols, closes, signals, times = [], [], [], []
+    for symbol, df in stock_data.items():
+        prices = pd.to_numeric(df[price_col], errors='coerce')
+        prices.index = pd.to_datetime(prices.index)
+        prices = prices.sort_index().dropna()
+
+        close = prices.values.astype(float)
+        signal = np.ones(len(close), dtype=bool)
+        if sma.get(symbol) is not None:
+            signal = close > _sma_values(sma[symbol], prices.index)
+
+        symbols.append(np.repeat(np.array([symbol], dtype=object), len(close)))
+        closes.append(close)
+        signals.append(signal)
+        times.append(prices.index.values)
 
-        # Starting price
-        execute_price = stock_data['4. close'][0]
+    lengths = np.array([len(c) for c in closes])
+    seg_end = np.cumsum(lengths)
+    seg_start = seg_end - lengths
 
-        for timestamp, price in stock_data.iterrows():
+    close = np.concatenate(closes) if closes else np.array([], dtype=float)
+    signal = np.concatenate(signals) if signals else np.array([], dtype=bool)
+    n = len(close)
+    bound = np.repeat(seg_end, lengths)
 
-            # If profited before, assign next closing price and executed price
-            if execute_price is None:
-                execute_price = price['4. close']
+    # First bar at or after each bar allowed to enter, within the same symbol (n if none)
+    entry_at = np.where(signal, np.arange(n), n)
+    entry_at = np.minimum.accumulate(entry_at[::-1])[::-1] if n else entry_at
+    entry_at = np.append(entry_at, n)
 
-            # If executed price lower than closing, we are profit making
-            if execute_price < price['4. close']:
-                profit = float(price['4. close'] - execute_price)
-                print(timestamp, 'Profit making trade.', profit)
+    exit_at = _next_higher(close, bound) if n else np.array([], dtype=int)
 
-                # Once profited, reset executed price to 0
-                execute_price = None
+    # Next entry after each bar's exit, n (terminal) when the symbol has no more trades
+    after_exit = np.where(exit_at >= 0, exit_at + 1, n)
+    next_entry = entry_at[np.minimum(after_exit, n)]
+    jump = np.append(np.where(next_entry < bound, next_entry, n), n)
 
-            # Skip and continue
-            else:
-                print(timestamp, 'Loss making trade.')
+    first = entry_at[seg_start]
+    first = np.where(first < seg_end, first, n)
+    entries = _follow_trades(first, jump, terminal=n)
+    exits = exit_at[entries]
+    closed = exits >= 0
 
+    all_times = np.concatenate(times) if times else np.array([], dtype='datetime64[ns]')
+    exit_price = np.where(closed, close[np.where(closed, exits, 0)], np.nan)
+    trades = pd.DataFrame({
+        'symbol': np.concatenate(symbols)[entries] if symbols else [],
+        'entry_time': all_times[entries],
+        'entry_price': close[entries],
+        'exit_time': pd.Series(all_times[np.where(closed, exits, 0)]).where(closed).values,
+        'exit_price': exit_price,
+        'profit': exit_price - close[entries],
+        'bars_held': np.where(closed, exits - entries, np.nan),
+    })
 
+    # Group on codes, the symbol is None for a single DataFrame and groupby drops null keys before pandas 1.1
+    codes, uniques = pd.factorize(trades['symbol'])
+    summary = trades.groupby(codes, sort=False).agg(
+        trades=('profit', 'count'),
+        total_profit=('profit', 'sum'),
+        mean_profit=('profit', 'mean'),
+        mean_bars_held=('bars_held', 'mean'),
+        open_position=('exit_price', lambda x: bool(x.isna().any())),
+    )
+    summary.index = pd.Index([uniques[code] if code >= 0 else None for code in summary.index], name='symbol')
 
+    return trades, summary
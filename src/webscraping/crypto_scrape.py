@@ -5,10 +5,9 @@ Author: Dencan Gan
 Script for scraping daily btc prices from coin market cap.
 """
 
-from src.utils import soupify
+from src.utils import fetch, table_to_df
 from src.utils import convert_object_to_datetime
 from datetime import datetime
-import pandas as pd
 
 
 class Crypto:
@@ -41,18 +40,9 @@ class Crypto:
         else:
             custom_link = default_link + '?start=' + start_date + '&end=' + end_date
 
-        # Pulling html
-        soup = soupify(url=custom_link)
-
-        historic_data = []
-        for x in (soup.select(self.pattern)):
-            historic_data.append(x.text)
-
-        data = {}
-        for i, e in enumerate(self.labels):
-            data[e] = historic_data[i::7]
-
-        df = pd.DataFrame(data)
+        # Pulling html and streaming the table rows
+        content = fetch(url=custom_link)
+        df = table_to_df(content, self.labels, cell_tag=self.pattern)
 
         df_ctd = convert_object_to_datetime(s=df).sort_values('Date')
         df_ctd = df_ctd.set_index('Date')
@@ -63,17 +53,11 @@ class Crypto:
         """
         link = r'https://coinmarketcap.com/currencies/' + self.crypto + '/historical-data/'
 
-        soup = soupify(url=link)  # Pulling html
-
-        historic_data = []
-
-        for x in (soup.select(self.pattern)):
-            print(x.text)
-            historic_data.append(x.text)
-
-        day_data = dict(zip(self.labels, historic_data[0:7]))
+        content = fetch(url=link)  # Pulling html
 
-        df = pd.DataFrame(day_data, index=[0])
+        # Latest day is the first table row
+        df = table_to_df(content, self.labels, nrows=1, cell_tag=self.pattern)
+        print(df)
 
         df_ctd = convert_object_to_datetime(s=df).sort_values('Date')
         df_ctd = df_ctd.set_index('Date')
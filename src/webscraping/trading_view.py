@@ -2,29 +2,21 @@
 """
 
 import pandas as pd
-from src.utils import soupify
+from src.utils import fetch, table_to_df
 
 
-def parse_to_df(soup, labels):
-
-    data = []
-    for x in (soup.select('td')):
-        data.append(x.text)
-
-    keys = {}
-    for i, e in enumerate(labels):
-        keys[e] = data[i::len(labels)]
-
-    return pd.DataFrame(keys)
+def parse_to_df(content, labels):
+    """Parses the html table in `content` (raw bytes) into a DataFrame, one row per table row."""
+    return table_to_df(content, labels)
 
 
 def crypto(num=None):
 
-    soup = soupify("https://uk.tradingview.com/markets/cryptocurrencies/prices-all")
+    content = fetch("https://uk.tradingview.com/markets/cryptocurrencies/prices-all")
     labels = ['Crypto', 'Market_Cap', 'FD_Market_Cap', 'Last', 'Available_Coins', 'Total_Coins',
               'Traded_Volume','Change %']
 
-    df = parse_to_df(soup, labels)
+    df = parse_to_df(content, labels)
     df['Crypto'] = df['Crypto'].str.replace('\n', "").str.replace("\t", "")
 
     if num is not None:
@@ -37,9 +29,9 @@ def stocks(region, category, num=None):
     labels = ['Ticker', 'Last', '% Change', 'Change', 'Signal', 'Vol', 'Mkt Cap', 'P/E', 'EPS', 'Employees',
               'Industry']
     link = 'https://www.tradingview.com/markets/stocks-' + region + '/' + category
-    soup = soupify(link)
+    content = fetch(link)
 
-    df = parse_to_df(soup, labels)
+    df = parse_to_df(content, labels)
     df['x'] = df['Ticker'].str.strip('\n').str.replace('\t', '').str.split('\n')
     df[['(new_ticker)', 'Name', '(blank)']] = pd.DataFrame(df.x.values.tolist(), index=df.index)
     df = df.drop(columns=['Ticker', '(blank)', 'x'])
@@ -52,10 +44,10 @@ def stocks(region, category, num=None):
 
 
 def currency(num=None):
-    soup = soupify(r"https://uk.tradingview.com/markets/currencies/rates-major/")
+    content = fetch(r"https://uk.tradingview.com/markets/currencies/rates-major/")
     labels = ['Currency_Pair', 'Last', 'Change %', 'Change', 'Bid', 'Ask', 'High', 'Low', 'Rating']
 
-    df = parse_to_df(soup, labels)
+    df = parse_to_df(content, labels)
     df['Currency_Pair'] = df['Currency_Pair'].str.replace('\n', "").str.replace('\t', '-')
 
     if num is not None:
@@ -65,9 +57,9 @@ def currency(num=None):
 
 
 def indices(num=None):
-    soup = soupify(r"https://uk.tradingview.com/markets/indices/quotes-major/")
+    content = fetch(r"https://uk.tradingview.com/markets/indices/quotes-major/")
     labels = ["Index", "Last", "Change %", "Change", "High", "Low", "Rating"]
-    df = parse_to_df(soup, labels)
+    df = parse_to_df(content, labels)
     df['Index'] = df['Index'].str.replace('\n', "").str.replace('\t', '-')
 
     if num is not None:
@@ -3,6 +3,10 @@ Initial webscraping functions.
 GET request and BeautifulSoup parsing.
 """
 import json
+import io
+import os
+import hashlib
+import warnings
 import numpy as np
 import smtplib
 import re
@@ -12,169 +16,856 @@ from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import string
+import threading
+import time
+import asyncio
 from os.path import basename
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 
-from contextlib import closing
-from requests import get
+from collections import OrderedDict
+from contextlib import closing, contextmanager, nullcontext
+from requests import Session
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
 import pandas as pd
 
 
-def soupify(url):
+# Process-wide keep-alive session, so repeated requests to the same host reuse the TCP/TLS connection
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+
+def get_session(pool_maxsize=10):
+    """Returns the shared requests.Session used by soupify and soupify_many.
+
+    Arg:
+        pool_maxsize: int
+            Minimum number of keep-alive connections kept per host. The pool is only ever grown.
+
+    Returns:
+        requests.Session
+    """
+    global _session, _session_pool_size
+
+    with _session_lock:
+        if _session is None:
+            _session = Session()
+
+        if pool_maxsize > _session_pool_size:
+            adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session_pool_size = pool_maxsize
+
+    return _session
+
+
+def _fetch(url, session, headers=None):
+    """GET request through `session`.
+
+    Returns:
+        (status_code, content, response headers). content is the html body as bytes, or None if it could not be
+        received. status_code is None if the request itself failed.
+    """
+    try:
+        # Sending GET
+        with closing(session.get(url, stream=True, headers=headers)) as resp:
+            # Not modified since the validators sent in `headers`, body is empty
+            if resp.status_code == 304:
+                return resp.status_code, None, resp.headers
+
+            elif check_response(resp):
+                content = resp.content
+                print('Successfully received {u}'.format(u=url))
+                return resp.status_code, content, resp.headers
+
+            else:
+                print('Failed to receive {u}'.format(u=url))
+                return resp.status_code, None, resp.headers
+
+    except RequestException as e:
+        print('Error during requests to {0} : {1}'.format(url, str(e)))
+        return None, None, {}
+
+
+class LxmlNode(object):
+    """Thin BeautifulSoup-like adapter over an lxml.html element.
+
+    Only covers what the scrapers use: select, find_all, find, .text and attribute access. Skips building the
+    BeautifulSoup tree, which is several times slower than lxml alone on large pages.
+
+    Example:
+        >>> soup = LxmlNode(lxml.html.document_fromstring(content))
+        >>> soup.find("link", rel="canonical")["href"]
+    """
+
+    __slots__ = ("_el",)
+
+    _SIMPLE_TAG = re.compile(r"^[a-zA-Z][a-zA-Z0-9]*$")
+    # Attributes bs4 treats as whitespace separated lists
+    _MULTI_VALUED = ("class", "rel")
+
+    def __init__(self, el):
+        self._el = el
+
+    def __repr__(self):
+        return f"LxmlNode(<{self._el.tag}>)"
+
+    @property
+    def name(self):
+        return self._el.tag
+
+    @property
+    def text(self):
+        return self._el.text_content()
+
+    @property
+    def attrs(self):
+        return dict(self._el.attrib)
+
+    def get(self, attr, default=None):
+        return self._el.get(attr, default)
+
+    def __getitem__(self, attr):
+        value = self._el.get(attr)
+        if value is None:
+            raise KeyError(attr)
+        return value
+
+    def select(self, selector):
+        """CSS select. Plain tag selectors are served by lxml directly, anything else goes through cssselect."""
+        if self._SIMPLE_TAG.match(selector):
+            elements = self._el.iterdescendants(selector.lower())
+        else:
+            elements = self._el.cssselect(selector)
+        return [LxmlNode(e) for e in elements]
+
+    def _matches(self, el, attrs):
+        for attr, wanted in attrs.items():
+            value = el.get(attr)
+            if value is None:
+                return False
+            if attr in self._MULTI_VALUED:
+                if wanted not in value.split():
+                    return False
+            elif value != wanted:
+                return False
+        return True
+
+    def find_all(self, name=None, class_=None, **attrs):
+        if class_ is not None:
+            attrs["class"] = class_
+        elements = self._el.iterdescendants(name.lower()) if name else self._el.iterdescendants()
+        return [LxmlNode(e) for e in elements if isinstance(e.tag, str) and self._matches(e, attrs)]
+
+    def find(self, name=None, class_=None, **attrs):
+        found = self.find_all(name, class_=class_, **attrs)
+        return found[0] if found else None
+
+
+def _parse_bs4(content):
+    return BeautifulSoup(content, features="lxml")
+
+
+def _parse_lxml(content):
+    return LxmlNode(lxml.html.document_fromstring(content))
+
+
+# Parser backends by name, the default is used when soupify is not given one
+_PARSER_BACKENDS = {"bs4": _parse_bs4, "lxml": _parse_lxml}
+_parser_backend = "bs4"
+
+
+def set_parser_backend(backend):
+    """Sets the default parser backend used by soupify, 'bs4' (BeautifulSoup, default) or 'lxml' (LxmlNode)."""
+    global _parser_backend
+    if backend not in _PARSER_BACKENDS:
+        raise KeyError(f"Parser backend must be one of {list(_PARSER_BACKENDS)}")
+    _parser_backend = backend
+
+
+def _parse(content, backend=None):
+    """Parses html content with the given parser backend, defaults to the global one (see set_parser_backend)."""
+    if content is None:
+        return None
+    return _PARSER_BACKENDS[backend or _parser_backend](content)
+
+
+class HttpCache(object):
+    """On-disk cache of html bodies keyed by url, revalidated with conditional GET requests.
+
+    Bodies younger than `ttl` are served without touching the network. Older bodies are revalidated by sending
+    If-None-Match/If-Modified-Since, a 304 response reuses the stored body. Parsed soups are also kept in memory so
+    fresh hits and 304s skip the BeautifulSoup parse.
+    Note that the memoised soup is shared between callers, treat it as read-only.
+
+    Example:
+        >>> cache = HttpCache(cache_dir="C:/temp/scrape_cache", ttl=300)
+        >>> soup = soupify("https://uk.tradingview.com/markets/indices/quotes-major/", cache=cache)
+        >>> cache.stats()
+    """
+
+    def __init__(self, cache_dir, ttl=300, max_bytes=256 * 1024 ** 2, max_parsed=64):
+        """
+        Parameters
+        ----------
+        cache_dir: str
+            Folder to store bodies and the cache index in, created if it does not exist.
+        ttl: float
+            Seconds a stored body is served without revalidation.
+        max_bytes: int
+            Size bound of stored bodies, least recently used bodies are evicted first.
+        max_parsed: int
+            Number of parsed soups kept in memory.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_parsed = max_parsed
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+        self._lock = threading.RLock()
+        self._parsed = OrderedDict()
+        self._index_path = os.path.join(cache_dir, "index.json")
+
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self._index_path) as fp:
+                self._index = OrderedDict(json.load(fp))
+        except (FileNotFoundError, ValueError):
+            self._index = OrderedDict()
+
+    def _body_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + ".html")
+
+    def _save_index(self):
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump(self._index, fp)
+        os.replace(tmp, self._index_path)
+
+    def _touch(self, url):
+        # Index is kept in LRU order, most recently used last
+        self._index.move_to_end(url)
+
+    def _evict(self):
+        total = sum(e["size"] for e in self._index.values())
+        while total > self.max_bytes and self._index:
+            url, entry = self._index.popitem(last=False)
+            try:
+                os.remove(self._body_path(url))
+            except FileNotFoundError:
+                pass
+            self._forget_parsed(url)
+            total -= entry["size"]
+            self.evictions += 1
+
+    def _store(self, url, content, headers):
+        # Bodies are read outside the lock, write them atomically
+        path = self._body_path(url)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(content)
+        os.replace(tmp, path)
+        self._index[url] = {"etag": headers.get("ETag"),
+                            "last_modified": headers.get("Last-Modified"),
+                            "stored_at": time.time(),
+                            "size": len(content)}
+        self._touch(url)
+        self._forget_parsed(url)
+        self._evict()
+        self._save_index()
+
+    def _forget_parsed(self, url):
+        for key in [k for k in self._parsed if k[0] == url]:
+            del self._parsed[key]
+
+    def _drop(self, url):
+        """Forgets `url`, eg. when its stored body went missing."""
+        if self._index.pop(url, None) is not None:
+            self._forget_parsed(url)
+            self._save_index()
+
+    def _read_body(self, url):
+        try:
+            with open(self._body_path(url), "rb") as fp:
+                return fp.read()
+        except FileNotFoundError:
+            return None
+
+    def _cached_soup(self, url, backend):
+        """Memoised parse of the stored body for `url`, parsed outside the lock on a memo miss. None if no body."""
+        key = (url, backend)
+        with self._lock:
+            if key in self._parsed:
+                self._parsed.move_to_end(key)
+                return self._parsed[key]
+
+        content = self._read_body(url)
+        if content is None:
+            return None
+
+        soup = _parse(content, backend)
+        with self._lock:
+            if url in self._index:
+                self._memoise(key, soup)
+        return soup
+
+    def _memoise(self, key, soup):
+        self._parsed[key] = soup
+        while len(self._parsed) > self.max_parsed:
+            self._parsed.popitem(last=False)
+        return soup
+
+    def soupify(self, url, session, limiter=None, backend=None):
+        """soupify through the cache. `limiter` (HostLimiter) is only held while the network is used.
+        The lock is never held while reading bodies, parsing or fetching."""
+        backend = backend or _parser_backend
+        with self._lock:
+            entry = self._index.get(url)
+            fresh = entry is not None and time.time() - entry["stored_at"] < self.ttl
+
+        if fresh:
+            soup = self._cached_soup(url, backend)
+            if soup is not None:
+                with self._lock:
+                    self.hits += 1
+                    if url in self._index:
+                        self._touch(url)
+                return soup
+            # Stored body is gone, refetch without validators
+            with self._lock:
+                self._drop(url)
+            entry = None
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        with limiter.limit(url) if limiter is not None else nullcontext():
+            status, content, resp_headers = _fetch(url, session, headers=headers)
+
+        if status == 304:
+            with self._lock:
+                stored = url in self._index
+            soup = self._cached_soup(url, backend) if stored else None
+            if soup is not None:
+                with self._lock:
+                    self.revalidated += 1
+                    if url in self._index:
+                        self._index[url]["stored_at"] = time.time()
+                        self._touch(url)
+                        self._save_index()
+                return soup
+
+            # Not modified, but the stored body is gone: refetch without validators
+            with self._lock:
+                self._drop(url)
+            with limiter.limit(url) if limiter is not None else nullcontext():
+                status, content, resp_headers = _fetch(url, session)
+
+        with self._lock:
+            self.misses += 1
+            if content is None:
+                return None
+            self._store(url, content, resp_headers)
+
+        # Parse outside of the lock, then memoise unless the body was evicted meanwhile
+        soup = _parse(content, backend)
+        with self._lock:
+            if url in self._index:
+                self._memoise((url, backend), soup)
+        return soup
+
+    def stats(self):
+        """Returns cache counters and size as a dictionary."""
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "revalidated": self.revalidated,
+                    "evictions": self.evictions,
+                    "entries": len(self._index),
+                    "bytes": sum(e["size"] for e in self._index.values())}
+
+    def clear(self):
+        """Removes all stored bodies and resets the counters."""
+        with self._lock:
+            for url in list(self._index):
+                try:
+                    os.remove(self._body_path(url))
+                except FileNotFoundError:
+                    pass
+            self._index.clear()
+            self._parsed.clear()
+            self.hits = self.misses = self.revalidated = self.evictions = 0
+            self._save_index()
+
+
+def soupify(url, cache=None, backend=None):
     """Attempts to get the content at `url` by making an HTTP GET request. Then uses BeautifulSoup to parse the html.
 
     Arg:
         url: str
             Link to url to scrape information
-        parser: str
-            Bs4 parser type, see documentation for parser types. Defaults to 'html.parser'.
-            https://www.crummy.com/software/BeautifulSoup/bs4/doc/
+        cache: HttpCache or optional
+            On-disk response cache, defaults to None (always download).
+        backend: str or optional
+            Parser backend, 'bs4' or 'lxml'. Defaults to the global backend (see set_parser_backend).
             
     Returns:
     If parsed html content, otherwise return None.
     
     The closing() function ensures that any network resources are freed when they go out of scope in that with block.
     Using closing() like that is good practice and helps to prevent fatal errors and network timeouts.
+    The request goes through the shared keep-alive session (see get_session).
+    """
+    session = get_session()
+    if cache is not None:
+        return cache.soupify(url, session, backend=backend)
+    return _parse(_fetch(url, session)[1], backend)
+
+
+def fetch(url):
+    """GET request through the shared keep-alive session, returns the raw html body as bytes or None."""
+    return _fetch(url, get_session())[1]
+
+
+def iter_table_rows(content, cell_tag="td"):
+    """Streams table rows out of raw html without building a full document tree.
+
+    Arg:
+        content: bytes
+            Raw html, as returned by fetch.
+        cell_tag: str
+            Tag of the cells to collect, defaults to 'td'. Rows without such cells (eg. header rows) are skipped.
+
+    Yields:
+        list of cell texts for each <tr>, in document order.
     """
+    if not content:
+        return
+
+    for _, row in etree.iterparse(io.BytesIO(content), events=("end",), tag="tr", html=True, recover=True):
+        cells = ["".join(cell.itertext()) for cell in row.iterchildren(cell_tag)]
+
+        # Free the processed row and anything before it, so memory stays flat on long tables
+        row.clear()
+        parent = row.getparent()
+        if parent is not None:
+            while row.getprevious() is not None:
+                del parent[0]
+
+        if cells:
+            yield cells
+
+
+def table_to_df(content, labels, dtypes=None, nrows=None, cell_tag="td"):
+    """Builds a DataFrame from the html table rows in `content`.
+
+    Rows are appended one at a time to one buffer per column and the DataFrame is built once at the end.
+    Rows with fewer cells than `labels` are padded with None (rather than shifting every following cell) and rows
+    with more cells are truncated, a warning reports how many rows were affected.
+
+    Arg:
+        content: bytes
+            Raw html, as returned by fetch.
+        labels: list
+            Column names, one per cell.
+        dtypes: dict or optional
+            Column name to dtype, applied once the frame is built.
+        nrows: int or optional
+            Stop after this many rows.
+        cell_tag: str
+            Tag of the cells to collect, defaults to 'td'.
+
+    Returns:
+        pd.DataFrame
+    """
+    n_cols = len(labels)
+    buffers = [[] for _ in labels]
+    misaligned = 0
+
+    for i, cells in enumerate(iter_table_rows(content, cell_tag=cell_tag)):
+        if nrows is not None and i >= nrows:
+            break
 
+        if len(cells) != n_cols:
+            misaligned += 1
+            cells = (cells + [None] * n_cols)[:n_cols]
+
+        for buffer, cell in zip(buffers, cells):
+            buffer.append(cell)
+
+    if misaligned:
+        warnings.warn(f"{misaligned} table row(s) did not have {n_cols} cells and were padded/truncated.")
+
+    df = pd.DataFrame(dict(zip(labels, buffers)), columns=labels)
+
+    if dtypes:
+        df = df.astype(dtypes)
+
+    return df
+
+
+class HostLimiter(object):
+    """Caps the number of in-flight requests per host and spaces out request starts to the same host."""
+
+    def __init__(self, per_host_limit=2, min_interval=0.0):
+        """
+        Parameters
+        ----------
+        per_host_limit: int
+            Maximum number of concurrent requests to one host.
+        min_interval: float
+            Minimum number of seconds between two request starts to one host, 0 to disable.
+        """
+        if per_host_limit < 1:
+            raise ValueError("per_host_limit must be at least 1")
+
+        self.per_host_limit = per_host_limit
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
+
+    def _wait_turn(self, host):
+        if self.min_interval <= 0:
+            return
+
+        # Reserve the next start slot for this host, then sleep outside of the lock
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.min_interval
+
+        if start > now:
+            time.sleep(start - now)
+
+    @contextmanager
+    def limit(self, url):
+        """Context manager holding a request slot for the host of `url`."""
+        host = urlsplit(url).netloc
+        with self._semaphore(host):
+            self._wait_turn(host)
+            yield
+
+
+def _limited_soupify(url, session, limiter, cache=None, backend=None):
+    if cache is not None:
+        return cache.soupify(url, session, limiter=limiter, backend=backend)
+    with limiter.limit(url):
+        content = _fetch(url, session)[1]
+    # Parse outside of the host slot, parsing does not touch the network
+    return _parse(content, backend)
+
+
+def soupify_many(urls, max_concurrency=8, per_host_limit=2, min_interval=0.0, cache=None,
+                 backend=None):
+    """Concurrent soupify over many urls through the shared keep-alive session.
+
+    Arg:
+        urls: list
+            Links to scrape.
+        max_concurrency: int
+            Maximum number of requests in flight overall.
+        per_host_limit: int
+            Maximum number of requests in flight to one host.
+        min_interval: float
+            Minimum seconds between request starts to one host (rate limit), defaults to 0.
+        cache: HttpCache or optional
+            On-disk response cache shared by all urls, defaults to None.
+        backend: str or optional
+            Parser backend, 'bs4' or 'lxml'. Defaults to the global backend (see set_parser_backend).
+
+    Returns:
+        List of parsed html content (or None for failed urls), in the same order as `urls`.
+
+    Example:
+        >>> soups = soupify_many(["https://uk.tradingview.com/markets/indices/quotes-major/",
+        ...                       "https://uk.tradingview.com/markets/currencies/rates-major/"])
+    """
+    urls = list(urls)
+    if not urls:
+        return []
+
+    session = get_session(pool_maxsize=max_concurrency)
+    limiter = HostLimiter(per_host_limit=per_host_limit, min_interval=min_interval)
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(urls))) as pool:
+        # map preserves input order
+        return list(pool.map(lambda u: _limited_soupify(u, session, limiter, cache, backend), urls))
+
+
+async def soupify_many_async(urls, max_concurrency=8, per_host_limit=2, min_interval=0.0, cache=None,
+                             backend=None):
+    """Asyncio variant of soupify_many, awaitable from a running event loop.
+
+    Requests are made on a bounded thread pool over the shared keep-alive session so the event loop is never
+    blocked. Arguments and return value are the same as soupify_many.
+
+    Example:
+        >>> soups = asyncio.run(soupify_many_async(urls, max_concurrency=16))
+    """
+    urls = list(urls)
+    if not urls:
+        return []
+
+    loop = asyncio.get_running_loop()
+    session = get_session(pool_maxsize=max_concurrency)
+    limiter = HostLimiter(per_host_limit=per_host_limit, min_interval=min_interval)
+
+    pool = ThreadPoolExecutor(max_workers=min(max_concurrency, len(urls)))
     try:
-        # Sending GET
-        with closing(get(url, stream=True)) as resp:
-            if check_response(resp):
-                content = resp.content
-                print('Successfully received {u}'.format(u=url))
+        tasks = [loop.run_in_executor(pool, _limited_soupify, url, session, limiter, cache, backend)
+                 for url in urls]
+        # gather preserves input order
+        return await asyncio.gather(*tasks)
+    finally:
+        # Never wait here, that would block the event loop on fetches still running after an error or cancellation
+        pool.shutdown(wait=False)
 
-                # Using BeautifulSoup to parse
-                bs4_parse = BeautifulSoup(content, features="lxml")
-                return bs4_parse
 
-            else:
-                print('Failed to receive {u}'.format(u=url))
-                return None
+# Parse workload of each scraper, run against a saved page of that scraper by benchmark_parser_backends
+_SCRAPER_SELECTIONS = {
+    "trading_view": lambda soup: [x.text for x in soup.select("td")],
+    "crypto_scrape": lambda soup: [x.text for x in soup.select("td")],
+    "quotes": lambda soup: [x.text for x in soup.find_all("div", class_="quoteText")],
+    "wiki_search": lambda soup: (soup.find("link", rel="canonical"), [x.text for x in soup.select("p")]),
+}
 
-    except RequestException as e:
-        print('Error during requests to {0} : {1}'.format(url, str(e)))
-        return None
+
+def benchmark_parser_backends(fixtures, repeat=5):
+    """Times parse + select of every parser backend on html pages saved beforehand (none ship with the repo).
+
+    Arg:
+        fixtures: dict
+            Scraper name ('trading_view', 'crypto_scrape', 'quotes' or 'wiki_search') to path of a saved html page,
+            eg. saved with open(path, "wb").write(fetch(url)) from the scraper's url.
+        repeat: int
+            Number of runs per page and backend, the best run is reported.
+
+    Returns:
+        pd.DataFrame of best times in seconds, one row per scraper and one column per backend.
+
+    Example:
+        >>> with open("quotes.html", "wb") as fp:
+        ...     fp.write(fetch("https://www.goodreads.com/quotes"))
+        >>> benchmark_parser_backends({"quotes": "quotes.html"})
+    """
+    results = {}
+    for scraper, path in fixtures.items():
+        select = _SCRAPER_SELECTIONS[scraper]
+        with open(path, "rb") as fp:
+            content = fp.read()
+
+        results[scraper] = {}
+        for backend in _PARSER_BACKENDS:
+            timings = []
+            for _ in range(repeat):
+                time_start = time.perf_counter()
+                select(_parse(content, backend))
+                timings.append(time.perf_counter() - time_start)
+            results[scraper][backend] = min(timings)
+
+    df = pd.DataFrame.from_dict(results, orient="index")
+    df["speedup"] = df["bs4"] / df["lxml"]
+    return df
 
 
 def check_response(resp):
     """Checks if the response is correct. Returns True if the response seems to be HTML, False otherwise.
     """
     # 'text/html;charset=utf-8' should be expected
-    content_type = resp.headers['Content-Type'].lower()
+    content_type = resp.headers.get('Content-Type')
 
     # Status_code == 200 means http status is OK
-    return resp.status_code == 200 and content_type is not None and content_type.find('html') > -1
+    return resp.status_code == 200 and content_type is not None and content_type.lower().find('html') > -1
 
 
-def convert_object_to_datetime(s):
-    """Turning date from object to np.datetime64
+# Date formats inferred by _find_date_format, keyed by the shape of a sample of the date strings
+_date_formats = OrderedDict()
+_date_formats_lock = threading.Lock()
+_DATE_FORMATS_SIZE = 256
+_DATE_SHAPE = str.maketrans(string.digits + string.ascii_letters, "9" * 10 + "a" * 52)
 
-    Arg:
-        s (pd.Dataframe or pd.Series): Pass in dataframe if multi column process is needed
 
-    Returns:
-        pd.Series
-        pd.DataFrame: All columns containing "date" (case in-sensitive) will be amended
+def _date_signature(uniques, sample_size=16):
+    """Shapes (digits as 9, letters as a) of evenly spaced unique date strings, eg. ('99/99/9999',)."""
+    rows = np.linspace(0, len(uniques) - 1, min(sample_size, len(uniques))).astype(int)
+    return tuple(sorted(set(str(uniques[i]).translate(_DATE_SHAPE) for i in rows)))
 
-    Note:
-        This method can handle EITHER "/" or "-" date separators but not a combination of both.
-        Users should check that there are no mixtures of separators if s is an array
+
+def _find_date_format(uniques):
+    """Infers the strptime format of unique date strings, None to let pandas infer it."""
+    strings = pd.Series(uniques, dtype=object).astype(str)
+
+    # Default separator
+    sep = "-" if strings.str.contains("-").all() else "/"
+
+    # Split once, then every check is a vectorised comparison per date part
+    parts = strings.str.split("/|-", expand=True)
+    numbers = parts.apply(pd.to_numeric, errors="coerce")
+
+    year_col, month_col, date_col = None, None, None
+
+    if numbers.notnull().all().all():
+        month_pattern = "%m"
+        for i in range(parts.shape[-1]):
+            if (numbers[i] > 1000).all():
+                year_col = i
+            elif (numbers[i] <= 12).all():
+                month_col = i
+            elif (numbers[i] <= 31).all():
+                date_col = i
+    else:
+        # Only month can be string and must be in the middle
+        month_pattern = "%b"
+        date_col, month_col, year_col = 0, 1, 2
+
+    assert year_col is not None, "Cannot find year in date string"
+
+    if year_col >= parts.shape[-1] or numbers[year_col].isnull().any():
+        # Last resort couldn't figure format out, let pandas do it
+        return None
+    year_pattern = "%Y" if (numbers[year_col] > 1000).all() else "%y"
+
+    def month_and_date(current_sep, m, d, mp):
+        if m > d:
+            return current_sep.join(["%d", f"{mp}"])
+        else:
+            return current_sep.join([f"{mp}", "%d"])
+
+    if year_col == 0:
+        if month_col is not None and date_col is not None:
+            fmt = sep.join((year_pattern, month_and_date(sep, month_col, date_col, month_pattern)))
+        else:
+            fmt = sep.join([year_pattern, f"{month_pattern}", "%d"])  # default to non US style
+
+    elif year_col == 2:
+        if month_col is not None and date_col is not None:
+            fmt = sep.join([month_and_date(sep, month_col, date_col, month_pattern), year_pattern])
+        else:
+            fmt = sep.join(["%d", month_pattern, year_pattern])  # default to non US style
+
+    else:
+        raise ValueError("Year in the middle of date separators!")
+
+    return fmt
+
+
+def _parse_unique_dates(uniques, strict=True):
+    """
+    Parses unique date strings to datetime64[ns] values, with the format cached for strings of the same shape.
+    A cached format is only used if it parses every string and the strings are not ambiguous (every day and month
+    <= 12, readable either way round), otherwise the format is inferred again. Ambiguous columns never use or fill
+    the cache, so they parse the same whatever was converted before.
+    Returns None if parsing fails and not `strict`.
     """
 
-    def find_format(series):
+    def ambiguous(parsed_fmt, parsed):
+        # Months are always <= 12, so day and month can be swapped if every day is too
+        return "%d" in parsed_fmt and "%m" in parsed_fmt and (parsed.day <= 12).all()
 
-        # Default separator
-        sep = "/"
+    key = _date_signature(uniques)
+    with _date_formats_lock:
+        fmt = _date_formats.get(key)
+        if fmt is not None:
+            _date_formats.move_to_end(key)
 
-        if pd.Series(series).str.contains("-").all():
-            sep = "-"
+    if fmt is not None:
+        parsed = pd.to_datetime(uniques, format=fmt, errors="coerce")
+        if not parsed.isnull().any() and not ambiguous(fmt, parsed):
+            return np.asarray(parsed, dtype="datetime64[ns]")
 
-        x = pd.Series(series).str.split("/|-", expand=True).values
+    fmt = _find_date_format(uniques)
+    try:
+        parsed = pd.to_datetime(uniques, format=fmt)
+    except (ValueError, TypeError):
+        if strict:
+            raise
+        return None
 
-        try:
-            x = x.astype(int)
-            month_pattern = "%m"
-
-        except ValueError:
-            month_pattern = "%b"
-
-        year_col, month_col, date_col = None, None, None
-
-        for i in range(x.shape[-1]):
-            if x[:, i].dtype != object:
-                if all(x[:, i].astype(int) > 1000):
-                    year_col = i
-                elif all(x[:, i].astype(int) <= 12):
-                    month_col = i
-                elif all(x[:, i].astype(int) <= 31):
-                    date_col = i
-            else:
-                # Only month can be string and must be in the middle
-                date_col, month_col, year_col = 0, 1, 2
-                break
+    if fmt is not None and not ambiguous(fmt, pd.DatetimeIndex(parsed)):
+        with _date_formats_lock:
+            _date_formats[key] = fmt
+            if len(_date_formats) > _DATE_FORMATS_SIZE:
+                _date_formats.popitem(last=False)
+    return np.asarray(parsed, dtype="datetime64[ns]")
 
-        assert year_col is not None, "Cannot find year in date string"
 
-        try:
-            year_pattern = "%Y" if (x[:, year_col].astype(int) > 1000).all() else "%y"
-        except (ValueError, TypeError, IndexError):
-            # Last resort couldn't figure format out, let pandas do it
-            return None
+def _dates_from_strings(column, strict=True):
+    """Converts a Series of date strings through its unique values, None if parsing fails and not `strict`."""
+    codes, uniques = pd.factorize(column)
+    parsed = _parse_unique_dates(np.asarray(uniques, dtype=object), strict=strict) if len(uniques) else \
+        np.array([], dtype="datetime64[ns]")
+    if parsed is None:
+        return None
 
-        def month_and_date(current_sep, m, d, mp):
-            if m > d:
-                return current_sep.join(["%d", f"{mp}"])
-            else:
-                return current_sep.join([f"{mp}", "%d"])
+    # Lookup of every row's parsed value by its unique code, nulls (code -1) as NaT
+    values = parsed.take(codes, mode="clip") if len(parsed) else np.empty(len(codes), dtype="datetime64[ns]")
+    values[codes < 0] = np.datetime64("NaT")
+    return pd.Series(values, index=column.index, name=column.name)
 
-        if year_col == 0:
-            if month_col is not None and date_col is not None:
-                fmt = sep.join((year_pattern, month_and_date(sep, month_col, date_col, month_pattern)))
-            else:
-                fmt = sep.join([year_pattern, f"{month_pattern}", "%d"])  # default to non US style
 
-        elif year_col == 2:
-            if month_col is not None and date_col is not None:
-                fmt = sep.join([month_and_date(sep, month_col, date_col, month_pattern), year_pattern])
-            else:
-                fmt = sep.join(["%d", f"{month_pattern, year_pattern}"])  # default to non US style
+def convert_object_to_datetime(s):
+    """Turning date from object to np.datetime64
 
-        else:
-            raise ValueError("Year in the middle of date separators!")
+    Arg:
+        s (pd.Dataframe or pd.Series): Pass in dataframe if multi column process is needed
+
+    Returns:
+        pd.Series
+        pd.DataFrame: All columns containing "date" (case in-sensitive) will be amended
 
-        return fmt
+    Note:
+        This method can handle EITHER "/" or "-" date separators but not a combination of both.
+        Users should check that there are no mixtures of separators if s is an array
+    """
 
     # This is an extremely fast approach to datetime parsing. Some dates are often repeated.
-    # Rather than to re-parse these, we store all unique dates, parse them, and use a lookup to convert all dates.
+    # Rather than to re-parse these, we parse the unique dates only and look every row up by its unique code.
     if isinstance(s, pd.DataFrame):
-        out = s.copy(True)  # this is the bottleneck
-        for column_name, column in out.iteritems():
-            # Loop through all the columns passed in
-            if "date" in column_name.lower():
-                if column.dtype != "<M8[ns]" and ~column.isnull().all():
-                    # If date is provided as a string then ignore and set to int
-                    try:
-                        col = column.astype(int)
-                        out[column_name] = col
-                    except:
-                        # Find the date columns(case in-sensitive)
-                        # If pandas cant find the format, ignore error and maintain input
-                        u_dates = pd.to_datetime(column.unique(),
-                                                 format=find_format(column.unique()),
-                                                 errors="ignore")
-                        dates = dict(zip(column.unique(), u_dates.tolist()))
-                        out[column_name] = column.map(dates.get)
+        # Shallow copy, converted columns are replaced rather than written into
+        out = s.copy(deep=False)
+        for column_name in s.columns:
+            # Find the date columns(case in-sensitive)
+            if "date" not in str(column_name).lower():
+                continue
+            column = s[column_name]
+            if pd.api.types.is_datetime64_any_dtype(column.dtype) or column.isnull().all():
+                continue
+            # If date is provided as a string then ignore and set to int
+            try:
+                out[column_name] = column.astype(int)
+            except (ValueError, TypeError):
+                # If pandas cant find the format, ignore error and maintain input
+                dates = _dates_from_strings(column, strict=False)
+                if dates is not None:
+                    out[column_name] = dates
         return out
 
     else:
-        if s.dtype == "<M8[ns]":
+        if pd.api.types.is_datetime64_any_dtype(s.dtype):
             return s
-        # Get unique dates
-        u_dates = pd.to_datetime(s.unique(), format=find_format(s.unique()))
-        dates = dict(zip(s.unique(), u_dates.tolist()))
-        return s.map(dates.get)
+        return _dates_from_strings(s)
 
 
 class EmailObject(object):